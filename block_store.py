@@ -0,0 +1,196 @@
+import json
+import os
+import struct
+import threading
+
+from blockchain import Block
+from constants import Constants
+from deserialize_service import DeserializeService
+from utxo_set import UndoRecord, UtxoSet
+
+# record number -> (segment number, offset in segment, record length)
+_INDEX_ENTRY = struct.Struct(">IQI")
+
+
+class _RecordLog:
+    def __init__(self, directory: str, prefix: str, segment_size: int) -> None:
+        self._directory = directory
+        self._prefix = prefix
+        self._segment_size = segment_size
+        self._index_path = os.path.join(directory, f"{prefix}_index.dat")
+        self._index: list[tuple[int, int, int]] = []
+        self._load_index()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self._directory, f"{self._prefix}{segment:05d}.dat")
+
+    def _load_index(self) -> None:
+        if not os.path.exists(self._index_path):
+            return
+        with open(self._index_path, "rb") as f:
+            raw = f.read()
+        usable = len(raw) - len(raw) % _INDEX_ENTRY.size
+        for offset in range(0, usable, _INDEX_ENTRY.size):
+            segment, position, length = _INDEX_ENTRY.unpack_from(raw, offset)
+            path = self._segment_path(segment)
+            if not os.path.exists(path) or os.path.getsize(path) < position + length:
+                break
+            self._index.append((segment, position, length))
+        if len(self._index) * _INDEX_ENTRY.size != len(raw):
+            self._rewrite_index()
+
+    def _rewrite_index(self) -> None:
+        with open(self._index_path, "wb") as f:
+            for entry in self._index:
+                f.write(_INDEX_ENTRY.pack(*entry))
+
+    def append(self, record: bytes) -> None:
+        segment = self._index[-1][0] if self._index else 0
+        path = self._segment_path(segment)
+        if os.path.exists(path) and os.path.getsize(path) >= self._segment_size:
+            segment += 1
+            path = self._segment_path(segment)
+
+        with open(path, "ab") as f:
+            position = f.tell()
+            f.write(record)
+        with open(self._index_path, "ab") as f:
+            f.write(_INDEX_ENTRY.pack(segment, position, len(record)))
+        self._index.append((segment, position, len(record)))
+
+    def read(self, number: int) -> bytes:
+        segment, position, length = self._index[number]
+        with open(self._segment_path(segment), "rb") as f:
+            f.seek(position)
+            return f.read(length)
+
+    def iter_records(self, start: int = 0):
+        # Sequential scan that opens each segment once instead of once per record
+        f, open_segment = None, None
+        try:
+            for segment, position, length in self._index[start:]:
+                if segment != open_segment:
+                    if f is not None:
+                        f.close()
+                    f, open_segment = open(self._segment_path(segment), "rb"), segment
+                f.seek(position)
+                yield f.read(length)
+        finally:
+            if f is not None:
+                f.close()
+
+    def truncate(self, length: int) -> None:
+        if length >= len(self._index):
+            return
+        segment, position, _ = self._index[length]
+        with open(self._segment_path(segment), "r+b") as f:
+            f.truncate(position)
+        later = segment + 1
+        while os.path.exists(self._segment_path(later)):
+            os.remove(self._segment_path(later))
+            later += 1
+        del self._index[length:]
+        self._rewrite_index()
+
+
+class BlockStore:
+    def __init__(self, directory: str, segment_size: int = Constants.BLOCK_STORE_SEGMENT_SIZE) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self._directory = directory
+        self._blocks = _RecordLog(directory, "blk", segment_size)
+        self._undo = _RecordLog(directory, "rev", segment_size)
+        # One small header record per block, so the chain index is rebuilt without parsing block bodies
+        self._headers = _RecordLog(directory, "hdr", segment_size)
+        self._lock = threading.Lock()
+        self._sync_headers()
+
+    def _sync_headers(self) -> None:
+        # Stores written before header records existed, or cut short between the two writes, are brought in line
+        self._headers.truncate(len(self._blocks))
+        for height in range(len(self._headers), len(self._blocks)):
+            self._headers.append(self._header_record(self.read_block(height)))
+
+    @staticmethod
+    def _header_record(block: Block) -> bytes:
+        return json.dumps(block.header().to_dict()).encode()
+
+    def __len__(self) -> int:
+        return len(self._blocks)
+
+    def append(self, block: Block) -> None:
+        record = json.dumps(block.to_dict()).encode()
+        header_record = self._header_record(block)
+        with self._lock:
+            if block.index != len(self._blocks):
+                raise ValueError(f"Block #{block.index} does not extend the store at height {len(self._blocks)}")
+            self._blocks.append(record)
+            self._headers.append(header_record)
+
+    def read_block(self, height: int) -> Block:
+        with self._lock:
+            record = self._blocks.read(height)
+        return DeserializeService.deserialize_block(json.loads(record))
+
+    def iter_blocks(self, start: int = 0):
+        for record in self._blocks.iter_records(start):
+            yield DeserializeService.deserialize_block(json.loads(record))
+
+    def iter_headers(self, start: int = 0):
+        for record in self._headers.iter_records(start):
+            yield DeserializeService.deserialize_header(json.loads(record))
+
+    def undo_height(self) -> int:
+        return len(self._undo)
+
+    def append_undo(self, height: int, undo: UndoRecord) -> None:
+        record = json.dumps(undo.to_dict()).encode()
+        with self._lock:
+            if height != len(self._undo):
+                raise ValueError(f"Undo record #{height} does not extend the store at height {len(self._undo)}")
+            self._undo.append(record)
+
+    def read_undo(self, height: int) -> UndoRecord | None:
+        with self._lock:
+            if height >= len(self._undo):
+                return None
+            record = self._undo.read(height)
+        return DeserializeService.deserialize_undo(json.loads(record))
+
+    def truncate(self, height: int) -> None:
+        with self._lock:
+            self._blocks.truncate(height)
+            self._headers.truncate(height)
+            self._undo.truncate(height)
+            for snapshot_height in self._snapshot_heights():
+                if snapshot_height >= height:
+                    os.remove(self._snapshot_path(snapshot_height))
+
+    def _snapshot_path(self, height: int) -> str:
+        return os.path.join(self._directory, f"utxo{height:010d}.json")
+
+    def _snapshot_heights(self) -> list[int]:
+        return sorted(int(name[4:-5]) for name in os.listdir(self._directory)
+                      if name.startswith("utxo") and name.endswith(".json"))
+
+    def snapshot_height(self) -> int:
+        heights = self._snapshot_heights()
+        return heights[-1] if heights else -1
+
+    def write_snapshot(self, height: int, block_hash: str, utxo_set: UtxoSet) -> None:
+        path = self._snapshot_path(height)
+        with open(path + ".tmp", "w") as f:
+            json.dump(utxo_set.to_dict(height, block_hash), f)
+        os.replace(path + ".tmp", path)
+        for older in self._snapshot_heights():
+            if older < height:
+                os.remove(self._snapshot_path(older))
+
+    def read_snapshot(self) -> tuple[int, str, UtxoSet] | None:
+        height = self.snapshot_height()
+        if height < 0:
+            return None
+        with open(self._snapshot_path(height), "r") as f:
+            return DeserializeService.deserialize_utxo_snapshot(json.load(f))
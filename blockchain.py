@@ -1,28 +1,147 @@
-import copy
+import threading
 import time
-import hashlib
+from collections import OrderedDict
+from collections.abc import Sequence
 
 from constants import BlockField, BlockchainField, Constants, MetadataType
-from transaction import Transaction, TxOutput
+from mempool import Mempool
+from merkle import MerkleTree, verify_proof
+from miner import find_nonce, header_hash
+from transaction import Transaction, TxOutput, pack_hex, unpack_hex
+from utxo_set import UndoRecord, UtxoSet, UtxoView
+from verification import owns_address, verify_batch
+
+class BlockHeader:
+    __slots__ = ("_hash", "index", "_previous_hash", "_nonce", "timestamp", "_tx_hash")
+
+    def __init__(self,
+                 index: int,
+                 previous_hash: str,
+                 nonce: int,
+                 timestamp: float,
+                 tx_hash: str) -> None:
+        self._hash = None
+        self.index = index
+        self.previous_hash = previous_hash
+        self.nonce = nonce
+        self.timestamp = timestamp
+        self.tx_hash = tx_hash
+
+    @property
+    def previous_hash(self) -> str:
+        return unpack_hex(self._previous_hash)
+
+    @previous_hash.setter
+    def previous_hash(self, previous_hash: str) -> None:
+        self._previous_hash = pack_hex(previous_hash)
+        self._hash = None
+
+    @property
+    def nonce(self) -> int:
+        return self._nonce
+
+    @nonce.setter
+    def nonce(self, nonce: int) -> None:
+        self._nonce = nonce
+        self._hash = None
+
+    @property
+    def tx_hash(self) -> str:
+        return unpack_hex(self._tx_hash)
+
+    @tx_hash.setter
+    def tx_hash(self, tx_hash: str) -> None:
+        self._tx_hash = pack_hex(tx_hash)
+        self._hash = None
+
+    def hash(self) -> str:
+        # Held as the same str the chain's height index is keyed by, so caching it costs only the slot
+        if self._hash is None:
+            self._hash = header_hash(self.index, self.previous_hash, self.nonce, self.timestamp, self.tx_hash)
+        return self._hash
+
+    def has_transaction(self, txid: str, index: int, proof: list[str], tx_count: int) -> bool:
+        # tx_hash is the Merkle root of the block's transaction ids
+        return verify_proof(txid, index, proof, self.tx_hash, tx_count)
+
+    def to_dict(self) -> dict:
+        return {
+            BlockField.INDEX: self.index,
+            BlockField.PREVIOUS_HASH: self.previous_hash,
+            BlockField.NONCE: self.nonce,
+            BlockField.TIMESTAMP: self.timestamp,
+            BlockField.TX_HASH: self.tx_hash
+        }
+
 
 class Block:
+    __slots__ = ("_hash", "index", "_previous_hash", "_transactions", "_merkle_tree", "_nonce", "timestamp")
+
     def __init__(self,
                  index,
                  previous_hash,
                  transactions,
                  nonce: int =0,
                  timestamp=None) -> None:
+        self._hash = None
         self.index = index
         self.previous_hash = previous_hash
         self.transactions = transactions
         self.nonce = nonce
         self.timestamp = timestamp or time.time()
 
-        self._tx_hash = hashlib.sha256("".join(tx.hash() for tx in self.transactions).encode()).hexdigest()
+    @property
+    def previous_hash(self) -> str:
+        return unpack_hex(self._previous_hash)
+
+    @previous_hash.setter
+    def previous_hash(self, previous_hash: str) -> None:
+        self._previous_hash = pack_hex(previous_hash)
+        self._hash = None
+
+    @property
+    def transactions(self) -> list[Transaction]:
+        return self._transactions
+
+    @transactions.setter
+    def transactions(self, transactions: list[Transaction]) -> None:
+        self._transactions = transactions
+        self._merkle_tree = MerkleTree(tx.hash() for tx in transactions)
+        self._hash = None
+
+    @property
+    def merkle_root(self) -> str:
+        return self._merkle_tree.root()
+
+    def add_transaction(self, tx: Transaction) -> None:
+        self._transactions.append(tx)
+        self._merkle_tree.append(tx.hash())
+        self._hash = None
+
+    def tx_proof(self, txid: str) -> tuple[int, list[str]] | None:
+        for index, tx in enumerate(self._transactions):
+            if tx.hash() == txid:
+                return index, self._merkle_tree.proof(index)
+        return None
+
+    @property
+    def nonce(self) -> int:
+        return self._nonce
+
+    @nonce.setter
+    def nonce(self, nonce: int) -> None:
+        self._nonce = nonce
+        self._hash = None
 
     def hash(self) -> str:
-        block_string = f"{self.index}{self.previous_hash}{self.nonce}{self.timestamp}{self._tx_hash}"
-        return hashlib.sha256(block_string.encode()).hexdigest()
+        if self._hash is None:
+            self._hash = header_hash(self.index, self.previous_hash, self.nonce, self.timestamp, self.merkle_root)
+        return self._hash
+
+    def header(self) -> BlockHeader:
+        header = BlockHeader(self.index, self.previous_hash, self.nonce, self.timestamp, self.merkle_root)
+        header._hash = self.hash()
+        return header
 
     def to_dict(self) -> dict:
         return {
@@ -34,16 +153,161 @@ class Block:
         }
 
 
-def _create_genesis_block() -> Block:
+def create_genesis_block() -> Block:
     return Block(0, "0" * 64, [], 0, 1720000000.0)
 
 
-class Blockchain:
-    def __init__(self) -> None:
-        self.chain = [_create_genesis_block()]
-        self.pending_txs = []
-        self.utxo_set = {}
+class ChainIndex:
+    # Height index over a list of blocks or headers, shared by full and light chains
+    @property
+    def chain(self) -> list[Block]:
+        return self._chain
+
+    @chain.setter
+    def chain(self, blocks: list[Block]) -> None:
+        self._chain = blocks
+        self._reindex_chain()
+
+    @property
+    def headers(self) -> list[BlockHeader]:
+        return self._chain
+
+    @property
+    def tip_hash(self) -> str:
+        return self._chain[-1].hash()
+
+    def has_block(self, block_hash: str) -> bool:
+        return block_hash in self._heights
+
+    def get_height(self, block_hash: str) -> int | None:
+        return self._heights.get(block_hash)
+
+    def get_locator(self) -> list[str]:
+        locator = []
+        height = len(self._chain) - 1
+        step = 1
+        while height > 0:
+            locator.append(self._chain[height].hash())
+            if len(locator) >= 10:
+                step *= 2
+            height -= step
+        locator.append(self._chain[0].hash())
+        return locator
+
+    def connects_headers(self, headers: list[BlockHeader]) -> bool:
+        if not headers or self.get_height(headers[0].previous_hash) != headers[0].index - 1:
+            return False
+        for previous, header in zip(headers, headers[1:]):
+            if header.index != previous.index + 1 or header.previous_hash != previous.hash():
+                return False
+        return True
+
+    def _reindex_chain(self) -> None:
+        self._heights = {block.hash(): height for height, block in enumerate(self._chain)}
+
+
+class _LazyBlocks(Sequence):
+    # List-like view of a header-only chain; bodies are loaded one at a time when indexed
+    def __init__(self, blockchain: "Blockchain") -> None:
+        self._blockchain = blockchain
+
+    def __len__(self) -> int:
+        return len(self._blockchain.headers)
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self._blockchain.get_block(height) for height in range(*item.indices(len(self)))]
+        return self._blockchain.get_block(item)
+
+    def append(self, block: Block) -> None:
+        self._blockchain._append_block(block)
+
+
+class Blockchain(ChainIndex):
+    def __init__(self, store=None) -> None:
+        self._heights: dict[str, int] = {}
+        self._undo: dict[int, UndoRecord] = {}
+        self._store = store
+        # block hash -> body; bounded only when evicted bodies can be read back from the store
+        self._bodies: OrderedDict[str, Block] = OrderedDict()
+        self.pending_txs = Mempool()
+        self.utxo_set = UtxoSet()
         self.difficulty = Constants.DIFFICULTY
+        self.last_hash_rate = 0.0
+
+        if store is not None and len(store) > 0:
+            # Only headers are read here; bodies are read when the UTXO replay or a caller needs them
+            self._chain = []
+            for header in store.iter_headers():
+                self._index_header(header)
+            self._load_utxo_set()
+        else:
+            self.chain = [create_genesis_block()]
+            if store is not None:
+                store.append(self.get_block(0))
+            self._record_undo(0, UndoRecord([], []))
+
+    @property
+    def chain(self) -> Sequence[Block]:
+        return _LazyBlocks(self)
+
+    @chain.setter
+    def chain(self, blocks: list[Block]) -> None:
+        self._bodies.clear()
+        self._chain = []
+        self._heights = {}
+        for block in blocks:
+            self._append_header(block)
+
+    def get_block(self, height: int) -> Block:
+        if height < 0:
+            height += len(self._chain)
+        block_hash = self._chain[height].hash()
+        block = self._bodies.get(block_hash)
+        if block is None:
+            block = self._store.read_block(height)
+            self._cache_block(block_hash, block)
+        else:
+            self._bodies.move_to_end(block_hash)
+        return block
+
+    def _cache_block(self, block_hash: str, block: Block) -> None:
+        self._bodies[block_hash] = block
+        self._bodies.move_to_end(block_hash)
+        if self._store is None:
+            return
+        for cached_hash in list(self._bodies):
+            if len(self._bodies) <= Constants.BLOCK_CACHE_SIZE:
+                break
+            height = self.get_height(cached_hash)
+            # Bodies that never reached the store are the only copy and stay cached
+            if height is None or height < len(self._store):
+                del self._bodies[cached_hash]
+
+    def _index_header(self, header: BlockHeader) -> None:
+        self._chain.append(header)
+        self._heights[header.hash()] = len(self._chain) - 1
+
+    def _append_header(self, block: Block) -> None:
+        self._index_header(block.header())
+        self._cache_block(block.hash(), block)
+
+    def _append_block(self, block: Block) -> None:
+        if self._store is not None:
+            self._store.append(block)
+        self._append_header(block)
+
+    def get_headers_after(self, locator: list[str], limit: int) -> list[BlockHeader]:
+        start = 0
+        for block_hash in locator:
+            height = self.get_height(block_hash)
+            if height is not None:
+                start = height + 1
+                break
+        return self._chain[start:start + limit]
+
+    def get_blocks(self, start: int, end: int) -> list[Block]:
+        return [self.get_block(height) for height in range(start, min(end + 1, len(self._chain)))]
 
     def print_chain(self) -> None:
         print("\n📦 Current blockchain:")
@@ -52,69 +316,140 @@ class Blockchain:
             for tx in block.transactions:
                 print(f"    └─ tx {tx.hash()[:8]}")
 
-    def mine_block(self, miner_address: str) -> Block:
-        height = len(self.chain)
-        coinbase = Transaction([], [TxOutput(Constants.MINER_REWARD, miner_address)], {MetadataType.HEIGHT: height})
-        txs = [coinbase] + self.pending_txs
-        block = Block(height, self.chain[-1].hash(), txs)
-
-        while not block.hash().startswith("0" * self.difficulty):
-            block.nonce += 1
+    def mine_block(self,
+                   miner_address: str,
+                   workers: int | None = None,
+                   cancel_event: threading.Event | None = None) -> Block | None:
+        block = self.solve_block(self.create_block_template(miner_address), workers, cancel_event)
+        if block is not None:
+            self.pending_txs.remove_confirmed(block.transactions)
+        return block
 
-        self.pending_txs.clear()
+    def create_block_template(self, miner_address: str) -> Block:
+        height = len(self._chain)
+        coinbase = Transaction([], [TxOutput(Constants.MINER_REWARD, miner_address)], {MetadataType.HEIGHT: height})
+        return Block(height, self.tip_hash, [coinbase] + list(self.pending_txs))
+
+    def solve_block(self,
+                    block: Block,
+                    workers: int | None = None,
+                    cancel_event: threading.Event | None = None) -> Block | None:
+        # Reads neither the chain nor the mempool, so it may run off the thread that owns them
+        result = find_nonce(block, self.difficulty, workers or Constants.MINING_WORKERS, cancel_event)
+        if result is None:
+            return None
+        block.nonce = result.nonce
+        self.last_hash_rate = result.hash_rate
+        print(f"⛏️ Block #{block.index} mined: {result.attempts} hashes, {result.hash_rate:.0f} H/s")
         return block
 
-    def get_effective_utxo_set(self):
-        temp_utxo = copy.deepcopy(self.utxo_set)
+    def get_effective_utxo_set(self) -> UtxoView:
+        view = UtxoView(self.utxo_set)
 
-        for tx in self.pending_txs:
-            for txin in tx.inputs:
-                if txin.tx_id in temp_utxo and txin.index in temp_utxo[txin.tx_id]:
-                    del temp_utxo[txin.tx_id][txin.index]
-                    if not temp_utxo[txin.tx_id]:
-                        del temp_utxo[txin.tx_id]
-        return temp_utxo
+        for txid, index in self.pending_txs.spent_outpoints():
+            view.spend_output(txid, index)
+        return view
+
+    def get_spendable_outputs(self, address: str) -> list[tuple[str, int, TxOutput]]:
+        return self.get_effective_utxo_set().outputs_of(address)
 
     def add_transaction(self, tx):
-        if tx.hash() in [t.hash() for t in self.pending_txs]:
-            return False
-        if not self.validate_transaction(tx):
-            return False
-        self.pending_txs.append(tx)
-        return True
+        return self.add_transactions([tx])[0]
+
+    def add_transactions(self, txs: list[Transaction]) -> list[bool]:
+        results = [False] * len(txs)
+        candidates = [(i, tx) for i, tx in enumerate(txs)
+                      if tx not in self.pending_txs
+                      and not self.pending_txs.has_conflict(tx)
+                      and self._check_transaction(tx)]
+        items = [item for _, tx in candidates for item in tx.signature_items()]
+        verified = iter(verify_batch(items))
+        for i, tx in candidates:
+            signed = all([next(verified) for _ in tx.inputs])
+            results[i] = signed and self.pending_txs.add(tx)
+        return results
 
     def update_utxo_set(self, tx):
         txid = tx.hash()
         for txin in tx.inputs:
-            if txin.tx_id in self.utxo_set and txin.index in self.utxo_set[txin.tx_id]:
-                del self.utxo_set[txin.tx_id][txin.index]
-                if not self.utxo_set[txin.tx_id]:
-                    del self.utxo_set[txin.tx_id]
+            self.utxo_set.spend_output(txin.tx_id, txin.index)
         for index, txout in enumerate(tx.outputs):
-            if txid not in self.utxo_set:
-                self.utxo_set[txid] = {}
-            self.utxo_set[txid][index] = txout
+            self.utxo_set.add_output(txid, index, txout)
 
     def rebuild_utxo_set(self):
-        self.utxo_set = {}
-        spent = set()
-        for block in self.chain:
-            for tx in block.transactions:
-                txid = tx.hash()
-                for txin in tx.inputs:
-                    spent.add((txin.tx_id, txin.index))
-                for index, txout in enumerate(tx.outputs):
-                    if (txid, index) not in spent:
-                        if txid not in self.utxo_set:
-                            self.utxo_set[txid] = {}
-                        self.utxo_set[txid][index] = txout
+        self._reindex_chain()
+        self.utxo_set = UtxoSet()
+        self._undo.clear()
+        for height in range(len(self._chain)):
+            self._replay_block(height, self.get_block(height))
+
+    def _load_utxo_set(self):
+        # Undo records are only appended in height order, so a snapshot past the end of a lagging undo log
+        # would leave it behind for good; a full replay backfills it instead
+        undo_height = self._store.undo_height()
+        if undo_height < len(self._chain):
+            print(f"⚠️ Undo log ends at #{undo_height}, backfilling it up to #{len(self._chain) - 1}")
+        snapshot = self._store.read_snapshot()
+        if snapshot is not None:
+            height, block_hash, utxo_set = snapshot
+            if height < min(len(self._chain), undo_height) and self._chain[height].hash() == block_hash:
+                self.utxo_set = utxo_set
+                for tail_height in range(height + 1, len(self._chain)):
+                    self._replay_block(tail_height, self.get_block(tail_height))
+                return
+        self.rebuild_utxo_set()
+
+    def _replay_block(self, height: int, block: Block) -> None:
+        view = UtxoView(self.utxo_set)
+        for tx in block.transactions:
+            txid = tx.hash()
+            for txin in tx.inputs:
+                view.spend_output(txin.tx_id, txin.index)
+            for index, txout in enumerate(tx.outputs):
+                view.add_output(txid, index, txout)
+        self._record_undo(height, view.commit())
+
+    def _record_undo(self, height: int, undo: UndoRecord) -> None:
+        self._undo[height] = undo
+        self._undo.pop(height - Constants.MAX_REORG_DEPTH, None)
+        if self._store is None:
+            return
+        if self._store.undo_height() == height:
+            self._store.append_undo(height, undo)
+        if height % Constants.UTXO_SNAPSHOT_INTERVAL == 0 and height > self._store.snapshot_height():
+            self._store.write_snapshot(height, self._chain[height].hash(), self.utxo_set)
+
+    def disconnect_tip(self) -> Block | None:
+        height = len(self._chain) - 1
+        if height == 0:
+            return None
+
+        undo = self._undo.pop(height, None)
+        if undo is None and self._store is not None:
+            undo = self._store.read_undo(height)
+
+        block = self.get_block(height)
+        self._chain.pop()
+        self._heights.pop(block.hash(), None)
+        self._bodies.pop(block.hash(), None)
+        if undo is not None:
+            self.utxo_set.apply_undo(undo)
+        else:
+            self.rebuild_utxo_set()
+
+        if self._store is not None:
+            self._store.truncate(height)
+        return block
 
     def validate_transaction(self, tx):
+        return self._check_transaction(tx) and all(verify_batch(tx.signature_items()))
+
+    def _check_transaction(self, tx):
         input_sum = 0
         output_sum = 0
         for txin in tx.inputs:
-            utxo = self.utxo_set.get(txin.tx_id, {}).get(txin.index)
-            if not utxo:
+            utxo = self.utxo_set.get_output(txin.tx_id, txin.index)
+            if not utxo or not owns_address(txin.pubkey, utxo.address):
                 return False
             input_sum += utxo.amount
         for txout in tx.outputs:
@@ -122,23 +457,37 @@ class Blockchain:
         return output_sum <= input_sum
 
     def validate_block(self, block):
-        if block.previous_hash != self.chain[-1].hash():
-            return False
+        return self._validate_block(block) is not None
+
+    def validate_block_view(self, block) -> UtxoView | None:
+        # The UTXO changes of a valid block, which add_block can reuse while the tip stays the same
+        return self._validate_block(block)
 
-        temp_utxo = copy.deepcopy(self.utxo_set)
+    def _validate_block(self, block) -> UtxoView | None:
+        if block.previous_hash != self.tip_hash or block.index != len(self._chain):
+            return None
+
+        temp_utxo = UtxoView(self.utxo_set)
+        signatures = []
 
         for i, tx in enumerate(block.transactions):
             if tx.is_coinbase():
+                txid = tx.hash()
+                for idx, txout in enumerate(tx.outputs):
+                    temp_utxo.add_output(txid, idx, txout)
                 continue
 
             input_total = 0
             output_total = 0
 
             for txin in tx.inputs:
-                utxo = temp_utxo.get(txin.tx_id, {}).get(txin.index)
+                utxo = temp_utxo.get_output(txin.tx_id, txin.index)
                 if not utxo:
                     print(f"❌ In block: input {txin.tx_id[:8]}:{txin.index} not found")
-                    return False
+                    return None
+                if not owns_address(txin.pubkey, utxo.address):
+                    print(f"❌ In block: input {txin.tx_id[:8]}:{txin.index} is not owned by its public key")
+                    return None
                 input_total += utxo.amount
 
             for txout in tx.outputs:
@@ -146,39 +495,71 @@ class Blockchain:
 
             if input_total < output_total:
                 print(f"❌ Тx #{i}: input < output")
-                return False
+                return None
 
             for txin in tx.inputs:
-                del temp_utxo[txin.tx_id][txin.index]
-                if not temp_utxo[txin.tx_id]:
-                    del temp_utxo[txin.tx_id]
-            temp_utxo[tx.hash()] = {
-                idx: txout for idx, txout in enumerate(tx.outputs)
-            }
+                temp_utxo.spend_output(txin.tx_id, txin.index)
+            txid = tx.hash()
+            for idx, txout in enumerate(tx.outputs):
+                temp_utxo.add_output(txid, idx, txout)
+            signatures.extend(tx.signature_items())
 
-        return True
+        if not all(verify_batch(signatures)):
+            print("❌ In block: invalid signature")
+            return None
+
+        return temp_utxo
 
-    def add_block(self, block):
-        if block.previous_hash == self.chain[-1].hash():
-            if self.validate_block(block):
-                self.chain.append(block)
-                for tx in block.transactions:
-                    self.update_utxo_set(tx)
+    def add_block(self, block, view: UtxoView | None = None):
+        if block.previous_hash == self.tip_hash:
+            # A view built over a UTXO set that has since been replaced (e.g. rebuilt) cannot be committed
+            if view is None or view.base is not self.utxo_set:
+                view = self._validate_block(block)
+            if view is not None:
+                self._append_block(block)
+                self._record_undo(len(self._chain) - 1, view.commit())
+                self.pending_txs.remove_confirmed(block.transactions)
                 return True
         return False
 
-    def try_to_update_chain(self, blocks: list[Block]):
-        if len(self.chain) < len(blocks):
-            self.chain = blocks.copy()
-            self.rebuild_utxo_set()
+    def find_fork_height(self, blocks: list[Block]) -> int | None:
+        for height in range(min(len(self._chain), len(blocks)) - 1, -1, -1):
+            if self.get_height(blocks[height].hash()) == height:
+                return height
+        return None
+
+    def try_to_update_chain(self, blocks: list[Block | BlockHeader]) -> bool:
+        # Only blocks past the fork point need bodies; the shared prefix may be headers
+        if len(self._chain) >= len(blocks):
+            return False
+
+        fork_height = self.find_fork_height(blocks)
+        if fork_height is None:
+            print("❌ The received chain does not share our genesis block")
+            return False
+
+        pending = list(self.pending_txs)
+        disconnected = []
+        while len(self._chain) - 1 > fork_height:
+            disconnected.append(self.disconnect_tip())
+
+        for connected, block in enumerate(blocks[fork_height + 1:]):
+            if not self.add_block(block):
+                print(f"❌ Block #{block.index} of the received chain is invalid, keeping our chain")
+                rolled_back = [self.disconnect_tip() for _ in range(connected)]
+                for old_block in reversed(disconnected):
+                    self.add_block(old_block)
+                # Connecting the branch dropped its transactions and their conflicts from the mempool
+                self.add_transactions(pending + [tx for old_block in reversed(rolled_back)
+                                                 for tx in old_block.transactions if not tx.is_coinbase()])
+                return False
+
+        for old_block in reversed(disconnected):
+            self.add_transactions([tx for tx in old_block.transactions if not tx.is_coinbase()])
+        return True
 
     def get_balance(self, address: str) -> float:
-        balance = 0.0
-        for txid, outputs in self.utxo_set.items():
-            for index, txout in outputs.items():
-                if txout.address == address:
-                    balance += txout.amount
-        return balance
+        return self.utxo_set.get_balance(address)
 
     def to_dict(self):
         return {
@@ -0,0 +1,39 @@
+import json
+import os
+from typing import Iterable, Iterator
+
+from blockchain import Block, Blockchain
+from deserialize_service import DeserializeService
+
+
+def write_chain(path: str, blocks: Iterable[Block]) -> int:
+    # One JSON block per line, so neither the writer nor a reader holds more than one block
+    written = 0
+    with open(path + ".tmp", "w") as f:
+        for block in blocks:
+            f.write(json.dumps(block.to_dict()))
+            f.write("\n")
+            written += 1
+    os.replace(path + ".tmp", path)
+    return written
+
+
+def read_chain(path: str) -> Iterator[Block]:
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield DeserializeService.deserialize_block(json.loads(line))
+
+
+def import_chain(blockchain: Blockchain, blocks: Iterable[Block]) -> bool:
+    # Each block is validated and connected as soon as it is read
+    for block in blocks:
+        if block.index < len(blockchain.chain):
+            if blockchain.get_height(block.hash()) != block.index:
+                print(f"❌ Block #{block.index} of the imported chain conflicts with our chain")
+                return False
+            continue
+        if not blockchain.add_block(block):
+            print(f"❌ Block #{block.index} of the imported chain is invalid")
+            return False
+    return True
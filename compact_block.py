@@ -0,0 +1,79 @@
+import hashlib
+
+from blockchain import Block, BlockHeader
+from constants import CompactBlockField
+from mempool import Mempool
+from transaction import Transaction
+
+SHORT_ID_BYTES = 6
+
+
+def short_id(block_hash: str, txid: str) -> str:
+    # Keyed by the block hash so colliding transactions cannot be crafted ahead of time
+    return hashlib.blake2b(bytes.fromhex(txid), key=bytes.fromhex(block_hash), digest_size=SHORT_ID_BYTES).hexdigest()
+
+
+class PartialBlock:
+    def __init__(self, header: BlockHeader, transactions: list[Transaction | None]) -> None:
+        self.header = header
+        self.transactions = transactions
+
+    def missing(self) -> list[int]:
+        return [i for i, tx in enumerate(self.transactions) if tx is None]
+
+    def fill(self, indexes: list[int], txs: list[Transaction]) -> None:
+        for i, tx in zip(indexes, txs):
+            if 0 <= i < len(self.transactions):
+                self.transactions[i] = tx
+
+    def to_block(self) -> Block | None:
+        if self.missing():
+            return None
+        block = Block(self.header.index, self.header.previous_hash, self.transactions, self.header.nonce,
+                      self.header.timestamp)
+        # A short id collision yields the wrong transaction and therefore a different hash
+        return block if block.hash() == self.header.hash() else None
+
+
+class CompactBlock:
+    def __init__(self, header: BlockHeader, short_ids: list[str], prefilled: list[tuple[int, Transaction]]) -> None:
+        self.header = header
+        self.short_ids = short_ids
+        self.prefilled = prefilled
+
+    @staticmethod
+    def from_block(block: Block) -> "CompactBlock":
+        block_hash = block.hash()
+        # The coinbase is never in a peer's mempool, so it is always sent in full
+        prefilled = [(0, block.transactions[0])] if block.transactions else []
+        short_ids = [short_id(block_hash, tx.hash()) for tx in block.transactions[1:]]
+        return CompactBlock(block.header(), short_ids, prefilled)
+
+    def hash(self) -> str:
+        return self.header.hash()
+
+    def reconstruct(self, mempool: Mempool) -> PartialBlock:
+        block_hash = self.hash()
+        candidates: dict[str, Transaction | None] = {}
+        for tx in mempool:
+            key = short_id(block_hash, tx.hash())
+            # Ambiguous short ids are fetched from the peer instead of guessed
+            candidates[key] = None if key in candidates else tx
+
+        transactions: list[Transaction | None] = [None] * (len(self.short_ids) + len(self.prefilled))
+        for i, tx in self.prefilled:
+            transactions[i] = tx
+        short_ids = iter(self.short_ids)
+        for i, tx in enumerate(transactions):
+            if tx is None:
+                transactions[i] = candidates.get(next(short_ids))
+        return PartialBlock(self.header, transactions)
+
+    def to_dict(self) -> dict:
+        return {
+            CompactBlockField.HEADER: self.header.to_dict(),
+            CompactBlockField.SHORT_IDS: self.short_ids,
+            CompactBlockField.PREFILLED: [
+                {CompactBlockField.INDEX: i, CompactBlockField.TX: tx.to_dict()} for i, tx in self.prefilled
+            ]
+        }
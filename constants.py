@@ -2,14 +2,24 @@ from enum import Enum
 
 
 class MessageType:
+    HELLO = "hello"
     TX = "tx"
     BLOCK = "block"
-    REQUEST_CHAIN = "request_chain"
-    CHAIN = "chain"
+    GET_HEADERS = "get_headers"
+    HEADERS = "headers"
+    GET_BLOCKS = "get_blocks"
+    BLOCKS = "blocks"
     MINING = "mining"
     REBROADCAST = "rebroadcast"
     FINALISE_BLOCK = "finalize_block"
     DISCONNECT = "disconnect"
+    INV = "inv"
+    GET_DATA = "get_data"
+    COMPACT_BLOCK = "compact_block"
+    GET_BLOCK_TXN = "get_block_txn"
+    BLOCK_TXN = "block_txn"
+    SUBSCRIBE = "subscribe"
+    MERKLE_BLOCK = "merkle_block"
 
 class MessageField:
     TYPE = "type"
@@ -39,10 +49,76 @@ class BlockField:
     TRANSACTIONS = "transactions"
     NONCE = "nonce"
     TIMESTAMP = "timestamp"
+    TX_HASH = "tx_hash"
 
 class BlockchainField:
     BLOCKS = "blocks"
 
+class UndoField:
+    SPENT = "spent"
+    CREATED = "created"
+
+class UtxoSnapshotField:
+    HEIGHT = "height"
+    BLOCK_HASH = "block_hash"
+    OUTPUTS = "outputs"
+
+class SyncField:
+    HOST = "host"
+    PORT = "port"
+    LOCATOR = "locator"
+    HEADERS = "headers"
+    START = "start"
+    END = "end"
+    BLOCKS = "blocks"
+    LAST = "last"
+
+class HelloField:
+    HOST = "host"
+    PORT = "port"
+    FORMATS = "formats"
+    ACK = "ack"
+    LIGHT = "light"
+
+class InventoryField:
+    HOST = "host"
+    PORT = "port"
+    TXS = "txs"
+    BLOCKS = "blocks"
+
+class CompactBlockField:
+    HOST = "host"
+    PORT = "port"
+    BLOCK = "block"
+    HEADER = "header"
+    SHORT_IDS = "short_ids"
+    PREFILLED = "prefilled"
+    INDEX = "index"
+    TX = "tx"
+
+class BlockTxnField:
+    HOST = "host"
+    PORT = "port"
+    BLOCK_HASH = "block_hash"
+    INDEXES = "indexes"
+    TXS = "txs"
+
+class SubscribeField:
+    HOST = "host"
+    PORT = "port"
+    ADDRESSES = "addresses"
+    FROM_HEIGHT = "from_height"
+
+class MerkleBlockField:
+    HOST = "host"
+    PORT = "port"
+    HEADER = "header"
+    MATCHES = "matches"
+    TX_COUNT = "tx_count"
+    TX = "tx"
+    INDEX = "index"
+    PROOF = "proof"
+
 class DisconnectField:
     HOST = "host"
     PORT = "port"
@@ -59,8 +135,35 @@ class Constants:
     TIME_TO_SLEEP = 60
     MINER_REWARD = 50
     DIFFICULTY = 3
+    MEMPOOL_MAX_SIZE = 50_000
+    MINING_WORKERS = 1
+    VERIFY_WORKERS = 1
+    PARALLEL_VERIFY_THRESHOLD = 64
+    VERIFYING_KEY_CACHE_SIZE = 1024
+    SIGNATURE_CACHE_SIZE = 100_000
+    BLOCK_STORE_SEGMENT_SIZE = 64 * 1024 * 1024
+    UTXO_SNAPSHOT_INTERVAL = 100
+    MAX_REORG_DEPTH = 100
+    BLOCK_CACHE_SIZE = 128
+    MAX_HEADERS_PER_MESSAGE = 2000
+    MAX_BLOCKS_PER_MESSAGE = 16
+    MAX_FRAME_SIZE = 64 * 1024 * 1024
+    MAX_TX_BATCH = 256
+    PEER_SEND_QUEUE_SIZE = 10_000
+    MAX_SEND_ATTEMPTS = 5
+    CONNECT_TIMEOUT = 5.0
+    RECONNECT_BACKOFF_MIN = 0.5
+    RECONNECT_BACKOFF_MAX = 30.0
+    PEER_INVENTORY_SIZE = 10_000
+    GET_DATA_TIMEOUT = 30.0
+    MAX_ORPHAN_MATCHES = 100
 
 class RebroadcastField:
     HOST = "host"
     PORT = "port"
-    BLOCK = "block"
\ No newline at end of file
+    BLOCK_HASH = "block_hash"
+
+class FinaliseField:
+    HOST = "host"
+    PORT = "port"
+    BLOCK_HASH = "block_hash"
\ No newline at end of file
@@ -1,8 +1,12 @@
-from typing import List
+from typing import List, Tuple
 
-from blockchain import Block
-from constants import TxField, BlockField, BlockchainField, DisconnectField, RebroadcastField
+from blockchain import Block, BlockHeader
+from compact_block import CompactBlock
+from constants import TxField, BlockField, BlockchainField, DisconnectField, RebroadcastField, FinaliseField, UndoField, \
+    UtxoSnapshotField, SyncField, HelloField, InventoryField, CompactBlockField, BlockTxnField, \
+    SubscribeField, MerkleBlockField
 from transaction import Transaction, TxInput, TxOutput
+from utxo_set import UndoRecord, UtxoSet
 
 
 class DeserializeService:
@@ -14,9 +18,12 @@ class DeserializeService:
         return Transaction(inputs, outputs, metadata)
 
     @staticmethod
-    def deserialize_rebroadcast(data: dict) -> (str, int, Block):
-        block = DeserializeService.deserialize_block(data[RebroadcastField.BLOCK])
-        return data[RebroadcastField.HOST], int(data[RebroadcastField.PORT]), block
+    def deserialize_rebroadcast(data: dict) -> ((str, int), str):
+        return (data[RebroadcastField.HOST], int(data[RebroadcastField.PORT])), data[RebroadcastField.BLOCK_HASH]
+
+    @staticmethod
+    def deserialize_finalise(data: dict) -> ((str, int), str):
+        return (data[FinaliseField.HOST], int(data[FinaliseField.PORT])), data[FinaliseField.BLOCK_HASH]
 
     @staticmethod
     def deserialize_block(data: dict):
@@ -29,6 +36,34 @@ class DeserializeService:
             timestamp=data[BlockField.TIMESTAMP]
         )
 
+    @staticmethod
+    def deserialize_header(data: dict) -> BlockHeader:
+        return BlockHeader(
+            index=data[BlockField.INDEX],
+            previous_hash=data[BlockField.PREVIOUS_HASH],
+            nonce=data[BlockField.NONCE],
+            timestamp=data[BlockField.TIMESTAMP],
+            tx_hash=data[BlockField.TX_HASH]
+        )
+
+    @staticmethod
+    def deserialize_get_headers(data: dict) -> ((str, int), List[str]):
+        return (data[SyncField.HOST], int(data[SyncField.PORT])), data[SyncField.LOCATOR]
+
+    @staticmethod
+    def deserialize_headers(data: dict) -> ((str, int), List[BlockHeader]):
+        headers = [DeserializeService.deserialize_header(header) for header in data[SyncField.HEADERS]]
+        return (data[SyncField.HOST], int(data[SyncField.PORT])), headers
+
+    @staticmethod
+    def deserialize_get_blocks(data: dict) -> ((str, int), int, int):
+        return (data[SyncField.HOST], int(data[SyncField.PORT])), int(data[SyncField.START]), int(data[SyncField.END])
+
+    @staticmethod
+    def deserialize_blocks(data: dict) -> ((str, int), List[Block], bool):
+        blocks = [DeserializeService.deserialize_block(block) for block in data[SyncField.BLOCKS]]
+        return (data[SyncField.HOST], int(data[SyncField.PORT])), blocks, data[SyncField.LAST]
+
     @staticmethod
     def deserialize_chain(data: dict) -> List[Block]:
         blocks = [DeserializeService.deserialize_block(block) for block in data[BlockchainField.BLOCKS]]
@@ -36,4 +71,61 @@ class DeserializeService:
 
     @staticmethod
     def deserialize_disconnect(data: dict) -> (str, int):
-        return data[DisconnectField.HOST], data[DisconnectField.PORT]
\ No newline at end of file
+        return data[DisconnectField.HOST], data[DisconnectField.PORT]
+
+    @staticmethod
+    def deserialize_undo(data: dict) -> UndoRecord:
+        spent = [(txid, index, TxOutput(**txout)) for txid, index, txout in data[UndoField.SPENT]]
+        created = [(txid, index) for txid, index in data[UndoField.CREATED]]
+        return UndoRecord(spent, created)
+
+    @staticmethod
+    def deserialize_utxo_snapshot(data: dict) -> (int, str, UtxoSet):
+        utxo_set = UtxoSet()
+        for txid, index, txout in data[UtxoSnapshotField.OUTPUTS]:
+            utxo_set.add_output(txid, index, TxOutput(**txout))
+        return data[UtxoSnapshotField.HEIGHT], data[UtxoSnapshotField.BLOCK_HASH], utxo_set
+
+    @staticmethod
+    def deserialize_hello(data: dict) -> ((str, int), List[str], bool, bool):
+        peer = (data[HelloField.HOST], int(data[HelloField.PORT]))
+        return peer, data[HelloField.FORMATS], data[HelloField.ACK], data.get(HelloField.LIGHT, False)
+
+    @staticmethod
+    def deserialize_inventory(data: dict) -> ((str, int), List[str], List[str]):
+        peer = (data[InventoryField.HOST], int(data[InventoryField.PORT]))
+        return peer, data.get(InventoryField.TXS, []), data.get(InventoryField.BLOCKS, [])
+
+    @staticmethod
+    def deserialize_compact_block(data: dict) -> ((str, int), CompactBlock):
+        block = data[CompactBlockField.BLOCK]
+        prefilled = [(int(item[CompactBlockField.INDEX]), DeserializeService.deserialize_tx(item[CompactBlockField.TX]))
+                     for item in block[CompactBlockField.PREFILLED]]
+        compact = CompactBlock(DeserializeService.deserialize_header(block[CompactBlockField.HEADER]),
+                               block[CompactBlockField.SHORT_IDS], prefilled)
+        return (data[CompactBlockField.HOST], int(data[CompactBlockField.PORT])), compact
+
+    @staticmethod
+    def deserialize_get_block_txn(data: dict) -> ((str, int), str, List[int]):
+        peer = (data[BlockTxnField.HOST], int(data[BlockTxnField.PORT]))
+        return peer, data[BlockTxnField.BLOCK_HASH], [int(i) for i in data[BlockTxnField.INDEXES]]
+
+    @staticmethod
+    def deserialize_block_txn(data: dict) -> ((str, int), str, List[int], List[Transaction]):
+        peer = (data[BlockTxnField.HOST], int(data[BlockTxnField.PORT]))
+        txs = [DeserializeService.deserialize_tx(tx) for tx in data[BlockTxnField.TXS]]
+        return peer, data[BlockTxnField.BLOCK_HASH], [int(i) for i in data[BlockTxnField.INDEXES]], txs
+
+    @staticmethod
+    def deserialize_subscribe(data: dict) -> ((str, int), List[str], int):
+        peer = (data[SubscribeField.HOST], int(data[SubscribeField.PORT]))
+        return peer, data[SubscribeField.ADDRESSES], int(data[SubscribeField.FROM_HEIGHT])
+
+    @staticmethod
+    def deserialize_merkle_block(data: dict) -> ((str, int), BlockHeader, int, List[Tuple[Transaction, int, List[str]]]):
+        matches = [(DeserializeService.deserialize_tx(match[MerkleBlockField.TX]),
+                    int(match[MerkleBlockField.INDEX]),
+                    match[MerkleBlockField.PROOF]) for match in data[MerkleBlockField.MATCHES]]
+        peer = (data[MerkleBlockField.HOST], int(data[MerkleBlockField.PORT]))
+        header = DeserializeService.deserialize_header(data[MerkleBlockField.HEADER])
+        return peer, header, int(data[MerkleBlockField.TX_COUNT]), matches
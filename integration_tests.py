@@ -27,6 +27,9 @@ def temp_wallet_file2():
         f.write(privkey)
     return path
 
+async def _idle():
+    pass
+
 def test_miner_node_creates_block_and_updates_balance(temp_wallet_file1):
     host = "127.0.0.1"
     port = 1111
@@ -60,17 +63,17 @@ def test_node_can_synchronize_chain(temp_wallet_file1, temp_wallet_file2):
     miner_node._external_ip = host
     user_node._external_ip = host
 
-    miner_node._listen_tcp = None
-    user_node._listen_tcp = None
+    miner_node._listen_tcp = _idle
+    user_node._listen_tcp = _idle
 
     miner_node._handle_tcp_connection = None
     user_node._handle_tcp_connection = None
 
-    miner_node._listen_discovery = None
-    user_node._listen_discovery = None
+    miner_node._listen_discovery = _idle
+    user_node._listen_discovery = _idle
 
-    miner_node._broadcast_presence = None
-    user_node._broadcast_presence = None
+    miner_node._broadcast_presence = _idle
+    user_node._broadcast_presence = _idle
 
     def broadcast_to_user(message: dict):
         if len(miner_node.peers) > 0:
@@ -83,6 +86,9 @@ def test_node_can_synchronize_chain(temp_wallet_file1, temp_wallet_file2):
     miner_node._broadcast = broadcast_to_user
     user_node._broadcast = broadcast_to_miner
 
+    miner_node._send_to_peer = lambda peer, message: broadcast_to_user(message)
+    user_node._send_to_peer = lambda peer, message: broadcast_to_miner(message)
+
     # start miner node
     miner_node.start()
 
@@ -124,17 +130,17 @@ def test_transaction_propagates_between_nodes(temp_wallet_file1, temp_wallet_fil
     miner_node._external_ip = host
     user_node._external_ip = host
 
-    miner_node._listen_tcp = None
-    user_node._listen_tcp = None
+    miner_node._listen_tcp = _idle
+    user_node._listen_tcp = _idle
 
     miner_node._handle_tcp_connection = None
     user_node._handle_tcp_connection = None
 
-    miner_node._listen_discovery = None
-    user_node._listen_discovery = None
+    miner_node._listen_discovery = _idle
+    user_node._listen_discovery = _idle
 
-    miner_node._broadcast_presence = None
-    user_node._broadcast_presence = None
+    miner_node._broadcast_presence = _idle
+    user_node._broadcast_presence = _idle
 
     def broadcast_to_user(message: dict):
         if len(miner_node.peers) > 0:
@@ -147,6 +153,9 @@ def test_transaction_propagates_between_nodes(temp_wallet_file1, temp_wallet_fil
     miner_node._broadcast = broadcast_to_user
     user_node._broadcast = broadcast_to_miner
 
+    miner_node._send_to_peer = lambda peer, message: broadcast_to_user(message)
+    user_node._send_to_peer = lambda peer, message: broadcast_to_miner(message)
+
     # start miner node
     miner_node.start()
 
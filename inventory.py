@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+from typing import Iterable
+
+from constants import Constants
+
+
+class RecentSet:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._items: OrderedDict[str, None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, item: str) -> bool:
+        return item in self._items
+
+    def add(self, item: str) -> None:
+        self._items[item] = None
+        self._items.move_to_end(item)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+
+class PeerInventory:
+    # Hashes each peer is known to have, so they are neither announced nor sent to it twice
+    def __init__(self, max_per_peer: int = Constants.PEER_INVENTORY_SIZE) -> None:
+        self.max_per_peer = max_per_peer
+        self._known: dict[tuple[str, int], RecentSet] = {}
+
+    def mark(self, peer: tuple[str, int], hashes: Iterable[str]) -> None:
+        known = self._known.setdefault(peer, RecentSet(self.max_per_peer))
+        for item in hashes:
+            known.add(item)
+
+    def unseen(self, peer: tuple[str, int], hashes: Iterable[str]) -> list[str]:
+        known = self._known.get(peer)
+        if known is None:
+            return list(hashes)
+        return [item for item in hashes if item not in known]
+
+    def forget(self, peer: tuple[str, int]) -> None:
+        self._known.pop(peer, None)
+
+
+class RequestTracker:
+    # Hashes already requested from some peer; they are asked for again only after the timeout
+    def __init__(self, timeout: float = Constants.GET_DATA_TIMEOUT) -> None:
+        self.timeout = timeout
+        self._requested: OrderedDict[str, tuple[tuple[str, int], float]] = OrderedDict()
+
+    def __contains__(self, item: str) -> bool:
+        return item in self._requested
+
+    def _expire(self, now: float) -> None:
+        while self._requested:
+            _, (_, requested_at) = next(iter(self._requested.items()))
+            if now - requested_at < self.timeout:
+                break
+            self._requested.popitem(last=False)
+
+    def claim(self, peer: tuple[str, int], hashes: Iterable[str]) -> list[str]:
+        now = time.monotonic()
+        self._expire(now)
+        claimed = []
+        for item in hashes:
+            if item not in self._requested:
+                self._requested[item] = (peer, now)
+                claimed.append(item)
+        return claimed
+
+    def complete(self, item: str) -> tuple[str, int] | None:
+        entry = self._requested.pop(item, None)
+        return entry[0] if entry else None
+
+    def forget(self, peer: tuple[str, int]) -> None:
+        for item in [item for item, (requested_from, _) in self._requested.items() if requested_from == peer]:
+            del self._requested[item]
@@ -0,0 +1,116 @@
+from collections import OrderedDict
+
+from blockchain import BlockHeader, ChainIndex, create_genesis_block
+from constants import Constants
+from mempool import Mempool
+from transaction import Transaction, TxOutput
+from utxo_set import UtxoSet, UtxoView
+from verification import owns_address
+
+
+def matches_addresses(tx: Transaction, addresses: set[str]) -> bool:
+    if any(txout.address in addresses for txout in tx.outputs):
+        return True
+    return any(owns_address(txin.pubkey, address) for txin in tx.inputs if txin.pubkey for address in addresses)
+
+
+class LightChain(ChainIndex):
+    # Header-only chain that tracks just the wallet's own outputs, proven by Merkle proofs from full nodes
+    def __init__(self, addresses: list[str]) -> None:
+        self.addresses = set(addresses)
+        self.difficulty = Constants.DIFFICULTY
+        self.pending_txs = Mempool()
+        self.utxo_set = UtxoSet()
+        # block hash -> wallet transactions proven to be in that block
+        self._matched: dict[str, list[Transaction]] = {}
+        self._orphans: OrderedDict[str, list[Transaction]] = OrderedDict()
+        self.chain = [create_genesis_block().header()]
+
+    def _has_work(self, header: BlockHeader) -> bool:
+        return header.hash().startswith("0" * self.difficulty)
+
+    def add_headers(self, headers: list[BlockHeader]) -> bool:
+        if not self.connects_headers(headers):
+            return False
+        if not all(self._has_work(header) for header in headers):
+            print("❌ Headers without enough proof of work")
+            return False
+        fork_height = headers[0].index - 1
+        if fork_height + 1 + len(headers) <= len(self.chain):
+            return False
+
+        self.chain = self.chain[:fork_height + 1] + headers
+        for block_hash in [block_hash for block_hash in self._orphans if self.has_block(block_hash)]:
+            self._matched[block_hash] = self._orphans.pop(block_hash)
+        self._rebuild_wallet()
+        return True
+
+    def add_matched_block(self,
+                          header: BlockHeader,
+                          tx_count: int,
+                          matches: list[tuple[Transaction, int, list[str]]]) -> bool:
+        for tx, index, proof in matches:
+            if index >= tx_count or not header.has_transaction(tx.hash(), index, proof, tx_count):
+                print(f"❌ Invalid inclusion proof for tx {tx.hash()[:8]}")
+                return False
+        if len({tx.hash() for tx, _, _ in matches}) != len(matches):
+            print("❌ The same transaction is matched twice")
+            return False
+
+        block_hash = header.hash()
+        txs = [tx for tx, _, _ in matches]
+        if self.has_block(block_hash):
+            if txs:
+                self._matched[block_hash] = txs
+                self._rebuild_wallet()
+            return True
+        if txs:
+            self._orphans[block_hash] = txs
+            while len(self._orphans) > Constants.MAX_ORPHAN_MATCHES:
+                self._orphans.popitem(last=False)
+        return header.previous_hash == self.tip_hash and self.add_headers([header])
+
+    def _rebuild_wallet(self) -> None:
+        # Wallet history is small, so replaying it in chain order keeps reorgs and late proofs simple
+        self.utxo_set = UtxoSet()
+        confirmed = []
+        for _, block_hash in sorted((self.get_height(block_hash), block_hash) for block_hash in self._matched
+                                    if self.has_block(block_hash)):
+            for tx in self._matched[block_hash]:
+                txid = tx.hash()
+                for txin in tx.inputs:
+                    self.utxo_set.spend_output(txin.tx_id, txin.index)
+                for index, txout in enumerate(tx.outputs):
+                    if txout.address in self.addresses:
+                        self.utxo_set.add_output(txid, index, txout)
+                confirmed.append(tx)
+        self.pending_txs.remove_confirmed(confirmed)
+
+    def get_effective_utxo_set(self) -> UtxoView:
+        view = UtxoView(self.utxo_set)
+        for txid, index in self.pending_txs.spent_outpoints():
+            view.spend_output(txid, index)
+        return view
+
+    def get_spendable_outputs(self, address: str) -> list[tuple[str, int, TxOutput]]:
+        return self.get_effective_utxo_set().outputs_of(address)
+
+    def get_balance(self, address: str) -> float:
+        return self.utxo_set.get_balance(address)
+
+    def add_transaction(self, tx: Transaction) -> bool:
+        return self.add_transactions([tx])[0]
+
+    def add_transactions(self, txs: list[Transaction]) -> list[bool]:
+        # Only the wallet's own spends are tracked; full nodes check everything else
+        results = []
+        for tx in txs:
+            view = self.get_effective_utxo_set()
+            owned = all(view.get_output(txin.tx_id, txin.index) is not None for txin in tx.inputs)
+            results.append(bool(tx.inputs) and owned and self.pending_txs.add(tx))
+        return results
+
+    def print_chain(self) -> None:
+        print("\n📦 Current headers:")
+        for header in self.chain:
+            print(f"  Block #{header.index} | hash: {header.hash()[:8]}... | prev: {header.previous_hash[:8]}...")
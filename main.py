@@ -3,12 +3,15 @@ import socket
 import random
 import os
 
-from constants import Role, Stage
+from constants import Role, Stage, Constants
 from node import Node
 from transaction import TxInput, TxOutput, Transaction
 from wallet import save_wallet, generate_keypair
 
 WALLET_FILE = os.getenv("WALLET_FILE", "my_wallet.txt")
+DATA_DIR = os.getenv("DATA_DIR")
+Constants.MINING_WORKERS = int(os.getenv("MINING_WORKERS", Constants.MINING_WORKERS))
+Constants.VERIFY_WORKERS = int(os.getenv("VERIFY_WORKERS", Constants.VERIFY_WORKERS))
 
 def ensure_wallet():
     if not os.path.exists(WALLET_FILE):
@@ -37,6 +40,7 @@ def show_menu(node: Node):
         print("3. Send coins")
         print("4. Show blockchain")
         print("5. Show peers")
+        print("6. Show message stats")
         print("0. Exit")
 
         choice = input("Choice: ").strip()
@@ -59,11 +63,16 @@ def show_menu(node: Node):
             except:
                 print(f"❌ Data error")
         elif choice == "4":
-            node.blockchain.print_chain()
+            node.print_chain()
         elif choice == "5":
             print("🔗 Connected peers:")
             for peer in node.peers:
                 print(" -", peer)
+        elif choice == "6":
+            print("📨 Queued messages:", node.message_queue.depths())
+            for msg_type, stats in node.message_metrics.snapshot().items():
+                print(f" - {msg_type}: {stats['count']} handled, "
+                      f"avg {stats['avg_latency'] * 1000:.1f} ms, max {stats['max_latency'] * 1000:.1f} ms")
         elif choice == "0":
             node.disconnect()
             print("👋 Goodbye!")
@@ -72,20 +81,15 @@ def show_menu(node: Node):
             print("⚠️ Incorrect input")
 
 def create_transaction(node: Node, to_address: str, amount: int) -> Transaction | None:
-    utxos = node.blockchain.get_effective_utxo_set()
     my_address = node.address
     my_privkey = node.private_key
 
     selected_inputs = []
     total = 0
 
-    for txid, outputs in utxos.items():
-        for index, out in outputs.items():
-            if out.address == my_address:
-                selected_inputs.append((txid, index, out.amount))
-                total += out.amount
-                if total >= amount:
-                    break
+    for txid, index, out in node.get_spendable_outputs(my_address):
+        selected_inputs.append((txid, index, out.amount))
+        total += out.amount
         if total >= amount:
             break
 
@@ -105,15 +109,18 @@ def create_transaction(node: Node, to_address: str, amount: int) -> Transaction
 
 if __name__ == "__main__":
     role = Role.USER
+    light = False
 
     if len(sys.argv) > 1:
         command = sys.argv[1]
         if command == "miner":
             role = Role.MINER
+        elif command == "light":
+            light = True
 
     ensure_wallet()
     port = choose_port()
-    node = Node("0.0.0.0", port, role)
+    node = Node("0.0.0.0", port, role, data_dir=DATA_DIR, light=light)
     node.start()
 
     show_menu(node)
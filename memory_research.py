@@ -0,0 +1,158 @@
+import base64
+import hashlib
+import json
+import os
+import sys
+import tracemalloc
+
+from blockchain import Blockchain, Block
+from deserialize_service import DeserializeService
+from mempool import Mempool
+from utxo_set import UtxoSet
+
+
+def _hex(seed: str) -> str:
+    return hashlib.sha256(seed.encode()).hexdigest()
+
+
+def _tx_data(number: int) -> dict:
+    # Shaped like a received transaction: one signed input, a payment and a change output
+    return {
+        "inputs": [{
+            "tx_id": _hex(f"prev{number}"),
+            "index": 0,
+            "signature": base64.b64encode(os.urandom(64)).decode(),
+            "pubkey": base64.b64encode(os.urandom(64)).decode()
+        }],
+        "outputs": [
+            {"amount": 1, "address": _hex(f"receiver{number}")},
+            {"amount": 49, "address": _hex(f"sender{number % 100}")}
+        ],
+        "metadata": {}
+    }
+
+
+class _DictTxInput:
+    # Baseline stand-ins: the dict-backed, str-valued layout the core objects had before __slots__ and packing
+    def __init__(self, tx_id: str, index: int, signature: str, pubkey: str) -> None:
+        self.tx_id = tx_id
+        self.index = index
+        self.signature = signature
+        self.pubkey = pubkey
+
+
+class _DictTxOutput:
+    def __init__(self, amount: int, address: str) -> None:
+        self.amount = amount
+        self.address = address
+
+
+class _DictTransaction:
+    def __init__(self, inputs: list[_DictTxInput], outputs: list[_DictTxOutput], metadata: dict) -> None:
+        self._hash = None
+        self.inputs = inputs
+        self.outputs = outputs
+        self.metadata = metadata
+
+    def hash(self) -> str:
+        if self._hash is None:
+            self._hash = hashlib.sha256(json.dumps({
+                "inputs": [{"tx_id": i.tx_id, "index": i.index} for i in self.inputs],
+                "outputs": [{"amount": o.amount, "address": o.address} for o in self.outputs],
+                "metadata": self.metadata
+            }, sort_keys=True).encode()).hexdigest()
+        return self._hash
+
+
+class _DictHeader:
+    def __init__(self, index: int, previous_hash: str, nonce: int, timestamp: float, tx_hash: str) -> None:
+        self.index = index
+        self.previous_hash = previous_hash
+        self.nonce = nonce
+        self.timestamp = timestamp
+        self.tx_hash = tx_hash
+
+
+class _DictUtxoSet:
+    # Keyed by the hex txid, with a second str copy of every address in the index
+    def __init__(self) -> None:
+        self._outputs: dict[str, dict[int, _DictTxOutput]] = {}
+        self._by_address: dict[str, dict[tuple[str, int], _DictTxOutput]] = {}
+        self._balances: dict[str, int] = {}
+
+    def add_output(self, txid: str, index: int, txout: _DictTxOutput) -> None:
+        self._outputs.setdefault(txid, {})[index] = txout
+        self._by_address.setdefault(txout.address, {})[(txid, index)] = txout
+        self._balances[txout.address] = self._balances.get(txout.address, 0) + txout.amount
+
+
+def _measure(build) -> int:
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def _received_tx(number: int, baseline: bool = False):
+    # Parsed from JSON like a network message, so the object owns every string it keeps
+    data = json.loads(json.dumps(_tx_data(number)))
+    if not baseline:
+        return DeserializeService.deserialize_tx(data)
+    return _DictTransaction(
+        [_DictTxInput(i["tx_id"], i["index"], i["signature"], i["pubkey"]) for i in data["inputs"]],
+        [_DictTxOutput(o["amount"], o["address"]) for o in data["outputs"]],
+        data["metadata"]
+    )
+
+
+def bytes_per_utxo(amount: int, baseline: bool = False) -> float:
+    def build():
+        utxo_set = _DictUtxoSet() if baseline else UtxoSet()
+        for number in range(amount):
+            tx = _received_tx(number, baseline)
+            txid = tx.hash()
+            for index, txout in enumerate(tx.outputs):
+                utxo_set.add_output(txid, index, txout)
+        return utxo_set
+
+    return _measure(build) / (2 * amount)
+
+
+def bytes_per_mempool_tx(amount: int, baseline: bool = False) -> float:
+    def build():
+        mempool = Mempool(max_size=amount)
+        for number in range(amount):
+            mempool.add(_received_tx(number, baseline))
+        return mempool
+
+    return _measure(build) / amount
+
+
+def bytes_per_header(amount: int, baseline: bool = False) -> float:
+    # Counts each header's height index entry too, since the header's cached hash is that entry's key
+    def build():
+        blockchain = Blockchain()
+        for height in range(1, amount + 1):
+            block = Block(height, _hex(f"block{height - 1}"), [], height)
+            if baseline:
+                header = _DictHeader(block.index, block.previous_hash, block.nonce, block.timestamp, block.merkle_root)
+            else:
+                header = block.header()
+            blockchain.headers.append(header)
+            blockchain._heights[block.hash()] = height
+        return blockchain
+
+    return _measure(build) / amount
+
+
+if __name__ == "__main__":
+    AMOUNT_OF_TXS = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    print(f"{'':32}{'before':>8}{'after':>8}")
+    for name, measure in [("Bytes per UTXO", bytes_per_utxo),
+                          ("Bytes per mempool transaction", bytes_per_mempool_tx),
+                          ("Bytes per block header", bytes_per_header)]:
+        print(f"{name:32}{measure(AMOUNT_OF_TXS, baseline=True):>8.0f}{measure(AMOUNT_OF_TXS):>8.0f}")
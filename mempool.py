@@ -0,0 +1,66 @@
+from collections import OrderedDict
+
+from constants import Constants
+from transaction import Transaction
+
+
+class Mempool:
+    def __init__(self, max_size: int = Constants.MEMPOOL_MAX_SIZE) -> None:
+        self.max_size = max_size
+        self._txs: OrderedDict[str, Transaction] = OrderedDict()
+        self._spenders: dict[tuple[str, int], str] = {}
+
+    def __len__(self) -> int:
+        return len(self._txs)
+
+    def __iter__(self):
+        return iter(list(self._txs.values()))
+
+    def __contains__(self, item) -> bool:
+        txid = item.hash() if isinstance(item, Transaction) else item
+        return txid in self._txs
+
+    def get(self, txid: str) -> Transaction | None:
+        return self._txs.get(txid)
+
+    def get_spender(self, txid: str, index: int) -> str | None:
+        return self._spenders.get((txid, index))
+
+    def spent_outpoints(self) -> list[tuple[str, int]]:
+        return list(self._spenders)
+
+    def has_conflict(self, tx: Transaction) -> bool:
+        return any((txin.tx_id, txin.index) in self._spenders for txin in tx.inputs)
+
+    def add(self, tx: Transaction) -> bool:
+        txid = tx.hash()
+        if txid in self._txs or self.has_conflict(tx):
+            return False
+        self._txs[txid] = tx
+        for txin in tx.inputs:
+            self._spenders[(txin.tx_id, txin.index)] = txid
+        while len(self._txs) > self.max_size:
+            oldest = next(iter(self._txs))
+            self.remove(oldest)
+        return txid in self._txs
+
+    def remove(self, txid: str) -> Transaction | None:
+        tx = self._txs.pop(txid, None)
+        if tx is None:
+            return None
+        for txin in tx.inputs:
+            if self._spenders.get((txin.tx_id, txin.index)) == txid:
+                del self._spenders[(txin.tx_id, txin.index)]
+        return tx
+
+    def remove_confirmed(self, txs: list[Transaction]) -> None:
+        for tx in txs:
+            self.remove(tx.hash())
+            for txin in tx.inputs:
+                spender = self._spenders.get((txin.tx_id, txin.index))
+                if spender is not None:
+                    self.remove(spender)
+
+    def clear(self) -> None:
+        self._txs.clear()
+        self._spenders.clear()
@@ -0,0 +1,77 @@
+import hashlib
+from typing import Iterable
+
+EMPTY_ROOT = "0" * 64
+
+
+def _hash_pair(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(left + right).digest()
+
+
+class MerkleTree:
+    # Every level is cached; an odd node at the end of a level is paired with itself
+    def __init__(self, hashes: Iterable[str] = ()) -> None:
+        self._levels: list[list[bytes]] = [[]]
+        for item in hashes:
+            self.append(item)
+
+    def __len__(self) -> int:
+        return len(self._levels[0])
+
+    def append(self, item: str) -> None:
+        leaves = self._levels[0]
+        leaves.append(bytes.fromhex(item))
+        index = len(leaves) - 1
+        level = 0
+        # Only the ancestors of the new leaf change, one node per level
+        while len(self._levels[level]) > 1:
+            nodes = self._levels[level]
+            parent = index // 2
+            left = nodes[2 * parent]
+            right = nodes[2 * parent + 1] if 2 * parent + 1 < len(nodes) else left
+            if level + 1 == len(self._levels):
+                self._levels.append([])
+            above = self._levels[level + 1]
+            if parent < len(above):
+                above[parent] = _hash_pair(left, right)
+            else:
+                above.append(_hash_pair(left, right))
+            index = parent
+            level += 1
+
+    def root(self) -> str:
+        if not self._levels[0]:
+            return EMPTY_ROOT
+        return self._levels[-1][0].hex()
+
+    def proof(self, index: int) -> list[str]:
+        if not 0 <= index < len(self):
+            raise IndexError(f"No leaf at index {index}")
+        siblings = []
+        for nodes in self._levels[:-1]:
+            sibling = index ^ 1
+            siblings.append((nodes[sibling] if sibling < len(nodes) else nodes[index]).hex())
+            index //= 2
+        return siblings
+
+
+def verify_proof(item: str, index: int, proof: list[str], root: str, leaf_count: int) -> bool:
+    # The leaf count fixes the tree's shape, so the slot duplicated past an odd level cannot be proved as a leaf
+    if not 0 <= index < leaf_count or len(proof) != (leaf_count - 1).bit_length():
+        return False
+    try:
+        node = bytes.fromhex(item)
+        width = leaf_count
+        for sibling in proof:
+            sibling = bytes.fromhex(sibling)
+            if index % 2 == 0:
+                if index == width - 1 and sibling != node:
+                    return False
+                node = _hash_pair(node, sibling)
+            else:
+                node = _hash_pair(sibling, node)
+            index //= 2
+            width = (width + 1) // 2
+    except ValueError:
+        return False
+    return node.hex() == root
@@ -0,0 +1,77 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+from constants import MessageType, MessageField
+
+# Lower number is served first; messages of equal priority keep their arrival order
+_CONSENSUS, _CONTROL, _TRANSACTIONS = range(3)
+_PRIORITY_NAMES = ["consensus", "control", "transactions"]
+_PRIORITIES = {
+    MessageType.FINALISE_BLOCK: _CONSENSUS,
+    MessageType.BLOCK: _CONSENSUS,
+    MessageType.COMPACT_BLOCK: _CONSENSUS,
+    MessageType.GET_BLOCK_TXN: _CONSENSUS,
+    MessageType.BLOCK_TXN: _CONSENSUS,
+    MessageType.REBROADCAST: _CONSENSUS,
+    MessageType.MINING: _CONSENSUS,
+    MessageType.TX: _TRANSACTIONS,
+}
+_BATCHED_TYPES = {MessageType.TX}
+
+
+class MessageQueue:
+    # put() may be called from any thread; get_batch() runs on the owning event loop
+    def __init__(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+        self._queues: list[deque[tuple[float, dict]]] = [deque() for _ in _PRIORITY_NAMES]
+        self._ready = asyncio.Event()
+
+    def __len__(self) -> int:
+        return sum(len(queue) for queue in self._queues)
+
+    def depths(self) -> dict[str, int]:
+        return {name: len(queue) for name, queue in zip(_PRIORITY_NAMES, self._queues)}
+
+    def put(self, message: dict) -> None:
+        self._loop.call_soon_threadsafe(self._put, time.monotonic(), message)
+
+    def _put(self, enqueued_at: float, message: dict) -> None:
+        priority = _PRIORITIES.get(message.get(MessageField.TYPE), _CONTROL)
+        self._queues[priority].append((enqueued_at, message))
+        self._ready.set()
+
+    async def get_batch(self, max_batch: int) -> list[tuple[float, dict]]:
+        while not len(self):
+            self._ready.clear()
+            await self._ready.wait()
+
+        queue = next(queue for queue in self._queues if queue)
+        batch = [queue.popleft()]
+        msg_type = batch[0][1].get(MessageField.TYPE)
+        if msg_type in _BATCHED_TYPES:
+            while queue and len(batch) < max_batch and queue[0][1].get(MessageField.TYPE) == msg_type:
+                batch.append(queue.popleft())
+        return batch
+
+
+class MessageMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # message type -> [count, total latency, max latency]
+        self._latencies: dict[str, list] = {}
+
+    def record(self, msg_type: str, latency: float) -> None:
+        with self._lock:
+            stats = self._latencies.setdefault(msg_type, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += latency
+            stats[2] = max(stats[2], latency)
+
+    def snapshot(self) -> dict[str, dict]:
+        with self._lock:
+            return {
+                msg_type: {"count": count, "avg_latency": total / count, "max_latency": worst}
+                for msg_type, (count, total, worst) in self._latencies.items()
+            }
@@ -0,0 +1,101 @@
+import hashlib
+import multiprocessing
+import queue
+import threading
+import time
+
+_CANCEL_CHECK_INTERVAL = 10_000
+_RESULT_POLL_TIMEOUT = 0.1
+
+
+def header_hash(index, previous_hash, nonce, timestamp, tx_hash) -> str:
+    block_string = f"{index}{previous_hash}{nonce}{timestamp}{tx_hash}"
+    return hashlib.sha256(block_string.encode()).hexdigest()
+
+
+class MiningResult:
+    def __init__(self, nonce: int, attempts: int, elapsed: float) -> None:
+        self.nonce = nonce
+        self.attempts = attempts
+        self.elapsed = elapsed
+
+    @property
+    def hash_rate(self) -> float:
+        return self.attempts / self.elapsed if self.elapsed > 0 else float(self.attempts)
+
+
+def _target(difficulty: int) -> bytes | None:
+    # hexdigest().startswith("0" * difficulty) <=> digest < 16 ** (64 - difficulty)
+    if difficulty <= 0:
+        return None
+    return (16 ** (64 - min(difficulty, 64))).to_bytes(32, "big")
+
+
+def _search(index, previous_hash, timestamp, tx_hash, difficulty,
+            start: int, step: int, stop_event) -> int | None:
+    target = _target(difficulty)
+    if target is None:
+        return start
+
+    prefix = hashlib.sha256(f"{index}{previous_hash}".encode())
+    suffix = f"{timestamp}{tx_hash}".encode()
+    nonce = start
+    while stop_event is None or not stop_event.is_set():
+        for _ in range(_CANCEL_CHECK_INTERVAL):
+            attempt = prefix.copy()
+            attempt.update(str(nonce).encode() + suffix)
+            if attempt.digest() < target:
+                return nonce
+            nonce += step
+    return None
+
+
+def _search_worker(index, previous_hash, timestamp, tx_hash, difficulty,
+                   start: int, step: int, stop_event, results) -> None:
+    nonce = _search(index, previous_hash, timestamp, tx_hash, difficulty, start, step, stop_event)
+    if nonce is not None:
+        results.put(nonce)
+        stop_event.set()
+
+
+def find_nonce(block, difficulty: int, workers: int = 1,
+               cancel_event: threading.Event | None = None) -> MiningResult | None:
+    started = time.perf_counter()
+    nonce = _find_nonce(block, difficulty, workers, cancel_event)
+    if nonce is None:
+        return None
+    # Nonces are interleaved across workers, so every nonce below the winner has been tried
+    return MiningResult(nonce, nonce - block.nonce + 1, time.perf_counter() - started)
+
+
+def _find_nonce(block, difficulty: int, workers: int,
+                cancel_event: threading.Event | None) -> int | None:
+    header = (block.index, block.previous_hash, block.timestamp, block.merkle_root, difficulty)
+
+    if workers <= 1:
+        return _search(*header, block.nonce, 1, cancel_event)
+    ctx = multiprocessing.get_context()
+    stop_event = ctx.Event()
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=_search_worker,
+                    args=(*header, block.nonce + i, workers, stop_event, results),
+                    daemon=True)
+        for i in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        while True:
+            try:
+                return results.get(timeout=_RESULT_POLL_TIMEOUT)
+            except queue.Empty:
+                if cancel_event is not None and cancel_event.is_set():
+                    return None
+    finally:
+        stop_event.set()
+        for process in processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
@@ -1,13 +1,23 @@
-import queue
+import asyncio
 import socket
 import threading
-import json
 import time
+from concurrent.futures import ThreadPoolExecutor
 
-from blockchain import Blockchain, Block
-from constants import MessageType, MessageField, DisconnectField, Role, Stage, Constants, RebroadcastField
+import wire_format
+
+from block_store import BlockStore
+from compact_block import CompactBlock, PartialBlock
+from blockchain import Blockchain, Block, BlockHeader
+from constants import MessageType, MessageField, DisconnectField, Role, Stage, Constants, RebroadcastField, SyncField, \
+    HelloField, InventoryField, CompactBlockField, BlockTxnField, SubscribeField, MerkleBlockField
 from deserialize_service import DeserializeService
-from transaction import Transaction
+from inventory import PeerInventory, RequestTracker
+from light_client import LightChain, matches_addresses
+from message_queue import MessageQueue, MessageMetrics
+from peer_connection import PeerConnection, read_frame
+from transaction import Transaction, TxOutput
+from utxo_set import UtxoView
 from wallet import load_wallet, pubkey_to_address, get_public_key
 
 
@@ -23,28 +33,75 @@ def _get_local_ip():
     return ip
 
 
+class _DatagramProtocol(asyncio.DatagramProtocol):
+    def __init__(self, on_datagram):
+        self._on_datagram = on_datagram
+        self._transport = None
+
+    def connection_made(self, transport):
+        self._transport = transport
+
+    def datagram_received(self, data, addr):
+        self._on_datagram(self._transport, data, addr)
+
+
+# Messages a light node acts on; everything else needs full blocks
+_LIGHT_MESSAGE_TYPES = {MessageType.HELLO, MessageType.HEADERS, MessageType.MERKLE_BLOCK, MessageType.GET_DATA,
+                        MessageType.DISCONNECT}
+
+
 class Node:
-    def __init__(self, host: str, port: int, role: Role, wallet_file="my_wallet.txt"):
+    def __init__(self,
+                 host: str,
+                 port: int,
+                 role: Role,
+                 wallet_file="my_wallet.txt",
+                 data_dir: str | None = None,
+                 light: bool = False):
         self._host = host
         self._port = port
         self.peers = set()
-        self.blockchain = Blockchain()
         self.private_key = load_wallet(wallet_file)
         self.public_key = get_public_key(self.private_key)
         self.address = pubkey_to_address(self.public_key)
+        self.light = light
+        if light:
+            self.blockchain = LightChain([self.address])
+        else:
+            self.blockchain = Blockchain(BlockStore(data_dir) if data_dir else None)
         self._discovery_port = 9000
         self._external_ip = _get_local_ip()
         self.role = role
 
+        # block hash -> [block body once fetched, peers that voted for it]
         self._pending_blocks: dict[str, list] = {}
+        # block hash -> (tip it was validated on, its UTXO changes or None if invalid)
+        self._validation_results: dict[str, tuple[str, UtxoView | None]] = {}
+        self._finalising_hash: str | None = None
         self._block_lock = threading.Lock()
 
         self.stage: Stage = Stage.TX
         self._stage_lock = threading.Lock()
 
-        self.message_queue = queue.Queue()
+        self._loop = asyncio.new_event_loop()
+        # Handlers run one at a time off the event loop so blockchain access stays serialised
+        self._chain_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chain")
+        self._mining_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mining")
+        self.message_queue = MessageQueue(self._loop)
+        self.message_metrics = MessageMetrics()
 
-        self._mining_thread = None
+        self._peer_formats: dict[tuple[str, int], str] = {}
+        self._known_inventory = PeerInventory()
+        self._requested = RequestTracker()
+        self._partial_blocks: dict[str, tuple[tuple[str, int], PartialBlock]] = {}
+        self._connections: dict[tuple[str, int], PeerConnection] = {}
+        self._light_peers: set[tuple[str, int]] = set()
+        self._subscriptions: dict[tuple[str, int], set[str]] = {}
+
+        # peer -> [buffered fork blocks, whether more headers follow]; each peer's BLOCKS stream is kept apart
+        self._syncs: dict[tuple[str, int], list] = {}
+
+        self._mining_cancel = threading.Event()
 
         print(f"🟢 Node launched at {self._external_ip}:{self._port}")
         print(f"🏠 Wallet address: {self.address[:8]}...")
@@ -58,186 +115,556 @@ class Node:
             return self.stage
 
     def start(self):
-        threading.Thread(target=self._listen_tcp, daemon=True).start()
-        threading.Thread(target=self._listen_discovery, daemon=True).start()
-        threading.Thread(target=self._broadcast_presence, daemon=True).start()
-        threading.Thread(target=self._process_message_queue, daemon=True).start()
+        threading.Thread(target=self._loop.run_forever, daemon=True).start()
+        for service in (self._listen_tcp, self._listen_discovery, self._broadcast_presence,
+                        self._process_message_queue):
+            asyncio.run_coroutine_threadsafe(self._run_service(service), self._loop)
+        self._schedule_mining_round()
 
-        self._mining_thread = threading.Thread(target=self._broadcast_mining, daemon=True)
-        self._mining_thread.start()
+    async def _run_service(self, service):
+        try:
+            await service()
+        except Exception as e:
+            print(f"❌ {service.__name__} stopped: {e}")
 
-    def _process_message_queue(self):
+    async def _process_message_queue(self):
         while True:
-            time.sleep(1)
-            message = self.message_queue.get()
+            batch = await self.message_queue.get_batch(Constants.MAX_TX_BATCH)
+            await self._loop.run_in_executor(self._chain_executor, self._handle_batch, batch)
+
+    def _handle_batch(self, batch: list[tuple[float, dict]]):
+        messages = [message for _, message in batch]
+        try:
+            if messages[0].get(MessageField.TYPE) == MessageType.TX:
+                self._handle_transactions([message.get(MessageField.DATA) for message in messages])
+            else:
+                self._handle_message(messages[0])
+        except Exception as e:
+            print(f"❌ Error handling message: {e}")
+
+        handled_at = time.monotonic()
+        for enqueued_at, message in batch:
+            self.message_metrics.record(message.get(MessageField.TYPE), handled_at - enqueued_at)
+
+    def _handle_transactions(self, data: list[dict]):
+        txs = []
+        for tx_data in data:
             try:
-                self._handle_message(message)
-            except Exception as e:
-                print(f"❌ Error handling message: {e}")
+                tx = DeserializeService.deserialize_tx(tx_data)
+            except (KeyError, TypeError, ValueError) as e:
+                print(f"❌ Malformed transaction: {e}")
+                continue
+            sender = self._requested.complete(tx.hash())
+            if sender is not None:
+                self._known_inventory.mark(sender, [tx.hash()])
+            txs.append(tx)
+
+        accepted = [tx.hash() for tx, added in zip(txs, self.blockchain.add_transactions(txs)) if added]
+        self._announce(tx_hashes=accepted)
 
     def disconnect(self):
         self._broadcast_disconnect()
+        if self._loop.is_running():
+            asyncio.run_coroutine_threadsafe(self._close_connections(), self._loop).result()
+
+    async def _close_connections(self):
+        connections = list(self._connections.values())
+        self._connections.clear()
+        await asyncio.gather(*(connection.close(timeout=Constants.CONNECT_TIMEOUT) for connection in connections))
 
     def verify_and_add_block(self, block):
-        if block.previous_hash == self.blockchain.chain[-1].hash():
-            if self.blockchain.validate_block(block):
+        if block.previous_hash == self.blockchain.tip_hash:
+            view = self._validated_view(block)
+            if view is not None and self.blockchain.add_block(block, view):
                 self._clear_pending_blocks()
-                self.blockchain.chain.append(block)
-                for tx in block.transactions:
-                    self.blockchain.update_utxo_set(tx)
+                self._notify_subscribers([block])
                 return True
             else:
                 print("❌ The block did not pass validation")
         return False
 
-    def _listen_tcp(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.bind((self._host, self._port))
-        sock.listen()
+    async def _listen_tcp(self):
+        server = await asyncio.start_server(self._handle_tcp_connection, self._host, self._port)
         print("📥 Waiting for TCP connections...")
-        while True:
-            conn, _ = sock.accept()
-            threading.Thread(target=self._handle_tcp_connection, args=(conn,), daemon=True).start()
+        async with server:
+            await server.serve_forever()
 
-    def _handle_tcp_connection(self, conn):
+    async def _handle_tcp_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
         try:
-            buffer = b""
-            while True:
-                chunk = conn.recv(10000)
-                if not chunk:
-                    break
-                buffer += chunk
-            data = buffer.decode()
-            message = json.loads(data)
-            self.message_queue.put(message)
+            while (raw := await read_frame(reader)) is not None:
+                try:
+                    self.message_queue.put(wire_format.decode(raw))
+                except ValueError as e:
+                    print("❌ Malformed message:", e)
         except Exception as e:
             print("❌ TCP error:", e)
         finally:
-            conn.close()
+            writer.close()
 
-    def _register_pending_block(self, block):
-        block_hash = block.hash()
+    def _register_pending_block(self,
+                                block_hash: str,
+                                block: Block | None = None,
+                                voter: tuple[str, int] | None = None):
         with self._block_lock:
-            if block_hash not in self._pending_blocks:
-                self._pending_blocks[block_hash] = [block, 1]
-            else:
-                self._pending_blocks[block_hash][1] += 1
+            entry = self._pending_blocks.setdefault(block_hash, [None, set()])
+            if block is not None:
+                entry[0] = block
+            if voter is not None:
+                entry[1].add(voter)
 
     def _get_best_pending_block(self):
         with self._block_lock:
-            if not self._pending_blocks:
-                return None
-            block, votes = max(self._pending_blocks.values(), key=lambda x: x[1])
-            return block, votes
+            candidates = [(block, len(voters)) for block, voters in self._pending_blocks.values() if block is not None]
+        if not candidates:
+            return None
+        return max(candidates, key=lambda x: x[1])
 
     def _clear_pending_blocks(self):
         with self._block_lock:
             self._pending_blocks.clear()
+        self._validation_results.clear()
+        self._partial_blocks.clear()
+        self._finalising_hash = None
+
+    def _validated_view(self, block: Block) -> UtxoView | None:
+        # A verdict is reused until the tip moves, so a voted block is not validated again when finalised
+        block_hash = block.hash()
+        tip_hash = self.blockchain.tip_hash
+        result = self._validation_results.get(block_hash)
+        if result is None or result[0] != tip_hash:
+            result = self._validation_results[block_hash] = (tip_hash, self.blockchain.validate_block_view(block))
+        return result[1]
+
+    def _is_valid_block(self, block: Block) -> bool:
+        return self._validated_view(block) is not None
 
     def _try_to_add_block(self):
-        if len(self._pending_blocks) > 0:
-            best_block, best_votes = self._get_best_pending_block()
-            if 2 * best_votes >= len(self.peers):
-                if self._is_leader():
-                    self._finalize_block(block=best_block)
-                    self.message_queue.put(
-                        {
-                            MessageField.TYPE: MessageType.FINALISE_BLOCK,
-                            MessageField.DATA: best_block.to_dict()
-                        }
-                    )
+        best = self._get_best_pending_block()
+        if best is None:
+            return
+        best_block, best_votes = best
+        if 2 * best_votes >= len(self._full_peers()):
+            if self._is_leader():
+                self._finalize_block(block=best_block)
+                self.message_queue.put(self._vote_message(MessageType.FINALISE_BLOCK, best_block.hash()))
+
+    def _vote_message(self, msg_type: str, block_hash: str) -> dict:
+        # REBROADCAST and FINALISE_BLOCK carry only the block hash; bodies travel once via inventory
+        return {
+            MessageField.TYPE: msg_type,
+            MessageField.DATA: {
+                RebroadcastField.HOST: self._external_ip,
+                RebroadcastField.PORT: self._port,
+                RebroadcastField.BLOCK_HASH: block_hash
+            }
+        }
 
     def _handle_message(self, message: dict):
         msg_type = message.get(MessageField.TYPE)
         data = message.get(MessageField.DATA)
+        if self.light and msg_type not in _LIGHT_MESSAGE_TYPES:
+            return
 
         if msg_type == MessageType.TX:
-            tx = DeserializeService.deserialize_tx(data)
-            self.blockchain.add_transaction(tx)
+            self._handle_transactions([data])
 
         elif msg_type == MessageType.FINALISE_BLOCK:
-            block = DeserializeService.deserialize_block(data)
-            self.verify_and_add_block(block)
+            self._mining_cancel.set()
+            peer, block_hash = DeserializeService.deserialize_finalise(data)
+            block = self._find_block(block_hash)
+            if block is not None:
+                self.verify_and_add_block(block)
+            elif not self.blockchain.has_block(block_hash):
+                # Applied by _receive_block once the body arrives
+                self._finalising_hash = block_hash
+                self._request_data(peer, [], self._requested.claim(peer, [block_hash]))
             self._set_stage(Stage.TX)
 
-            self._mining_thread = threading.Thread(target=self._broadcast_mining, daemon=True)
-            self._mining_thread.start()
+            self._schedule_mining_round()
 
         elif msg_type == MessageType.REBROADCAST:
             self._set_stage(Stage.MINING)
-            host, port, block = DeserializeService.deserialize_rebroadcast(data)
+            peer, block_hash = DeserializeService.deserialize_rebroadcast(data)
 
-            if block.previous_hash == self.blockchain.chain[-1].hash():
-                if self.blockchain.validate_block(block):
-                    self._register_pending_block(block)
+            if not self.blockchain.has_block(block_hash):
+                self._register_pending_block(block_hash, voter=peer)
+                if self._find_block(block_hash) is None:
+                    self._request_data(peer, [], self._requested.claim(peer, [block_hash]))
 
             self._try_to_add_block()
 
         elif msg_type == MessageType.BLOCK:
-            self._set_stage(Stage.MINING)
             block = DeserializeService.deserialize_block(data)
-
-            if block.previous_hash == self.blockchain.chain[-1].hash():
-                self._register_pending_block(block)
-
-                self._rebroadcast_block(block)
-                self.message_queue.put(
-                    {
-                        MessageField.TYPE: MessageType.REBROADCAST,
-                        MessageField.DATA: {
-                            RebroadcastField.HOST: self._external_ip,
-                            RebroadcastField.PORT: self._port,
-                            RebroadcastField.BLOCK: block.to_dict()
-                        }
-                    }
-                )
-
-        elif msg_type == MessageType.REQUEST_CHAIN:
-            self._broadcast_chain()
-
-        elif msg_type == MessageType.CHAIN:
-            blocks = DeserializeService.deserialize_chain(data)
-            self.blockchain.try_to_update_chain(blocks)
+            sender = self._requested.complete(block.hash())
+            if sender is not None:
+                self._known_inventory.mark(sender, [block.hash()])
+            self._receive_block(block)
+
+        elif msg_type == MessageType.COMPACT_BLOCK:
+            peer, compact = DeserializeService.deserialize_compact_block(data)
+            self._handle_compact_block(peer, compact)
+
+        elif msg_type == MessageType.GET_BLOCK_TXN:
+            peer, block_hash, indexes = DeserializeService.deserialize_get_block_txn(data)
+            block = self._find_block(block_hash)
+            if block is not None:
+                indexes = [i for i in indexes if 0 <= i < len(block.transactions)]
+                self._send_block_txn(peer, block_hash, indexes, [block.transactions[i] for i in indexes])
+
+        elif msg_type == MessageType.BLOCK_TXN:
+            peer, block_hash, indexes, txs = DeserializeService.deserialize_block_txn(data)
+            self._handle_block_txn(peer, block_hash, indexes, txs)
+
+        elif msg_type == MessageType.INV:
+            peer, tx_hashes, block_hashes = DeserializeService.deserialize_inventory(data)
+            self._known_inventory.mark(peer, tx_hashes + block_hashes)
+            wanted_txs = [txid for txid in tx_hashes if txid not in self.blockchain.pending_txs]
+            wanted_blocks = [block_hash for block_hash in block_hashes if self._find_block(block_hash) is None]
+            self._request_data(peer, self._requested.claim(peer, wanted_txs),
+                               self._requested.claim(peer, wanted_blocks))
+
+        elif msg_type == MessageType.GET_DATA:
+            peer, tx_hashes, block_hashes = DeserializeService.deserialize_inventory(data)
+            self._send_data(peer, tx_hashes, block_hashes)
+
+        elif msg_type == MessageType.HELLO:
+            peer, formats, ack, light = DeserializeService.deserialize_hello(data)
+            self._peer_formats[peer] = next((f for f in wire_format.SUPPORTED_FORMATS if f in formats),
+                                            wire_format.JSON_FORMAT)
+            if light:
+                self._light_peers.add(peer)
+            if not ack:
+                self._send_hello(peer, ack=True)
+
+        elif msg_type == MessageType.SUBSCRIBE:
+            peer, addresses, from_height = DeserializeService.deserialize_subscribe(data)
+            self._light_peers.add(peer)
+            self._subscriptions[peer] = set(addresses)
+            for height in range(max(from_height, 0), len(self.blockchain.chain)):
+                self._send_merkle_block(peer, self.blockchain.get_block(height), only_matches=True)
+
+        elif msg_type == MessageType.MERKLE_BLOCK:
+            peer, header, tx_count, matches = DeserializeService.deserialize_merkle_block(data)
+            if not self.blockchain.add_matched_block(header, tx_count, matches):
+                self._request_headers(peer)
+
+        elif msg_type == MessageType.GET_HEADERS:
+            peer, locator = DeserializeService.deserialize_get_headers(data)
+            headers = self.blockchain.get_headers_after(locator, Constants.MAX_HEADERS_PER_MESSAGE)
+            self._send_headers(peer, headers)
+
+        elif msg_type == MessageType.HEADERS:
+            peer, headers = DeserializeService.deserialize_headers(data)
+            self._handle_headers(peer, headers)
+
+        elif msg_type == MessageType.GET_BLOCKS:
+            peer, start, end = DeserializeService.deserialize_get_blocks(data)
+            self._send_blocks(peer, start, end)
+
+        elif msg_type == MessageType.BLOCKS:
+            peer, blocks, last = DeserializeService.deserialize_blocks(data)
+            sync = self._syncs.get(peer)
+            if sync is None:
+                print(f"⚠️ Unrequested blocks from {peer}")
+            else:
+                if not self._connect_synced_blocks(sync, blocks):
+                    sync[0].extend(blocks)
+                if last:
+                    self._apply_synced_blocks(peer)
 
         elif msg_type == MessageType.MINING:
             self._set_stage(Stage.MINING)
             if self.role == Role.MINER:
-                block = self.blockchain.mine_block(self.address)
-
-                self._broadcast_block(block)
-                self.message_queue.put({
-                    MessageField.TYPE: MessageType.BLOCK,
-                    MessageField.DATA: block.to_dict()
-                })
+                self._mining_cancel = threading.Event()
+                template = self.blockchain.create_block_template(self.address)
+                self._mining_executor.submit(self._mine_block, template, self._mining_cancel)
 
         elif msg_type == MessageType.DISCONNECT:
             peer_to_remove = DeserializeService.deserialize_disconnect(data)
-            self.peers.remove(peer_to_remove)
+            self.peers.discard(peer_to_remove)
+            self._light_peers.discard(peer_to_remove)
+            self._subscriptions.pop(peer_to_remove, None)
+            self._syncs.pop(peer_to_remove, None)
+            self._known_inventory.forget(peer_to_remove)
+            self._requested.forget(peer_to_remove)
+            asyncio.run_coroutine_threadsafe(self._close_connection(peer_to_remove), self._loop)
 
         else:
             print("⚠️ Unknown message type:", msg_type)
 
-    def _finalize_block(self, block: Block):
-        self._broadcast({
-            MessageField.TYPE: MessageType.FINALISE_BLOCK,
+    def _mine_block(self, template: Block, cancel_event: threading.Event):
+        # Runs on the mining executor; the template was built and the result is applied on the chain executor
+        block = self.blockchain.solve_block(template, Constants.MINING_WORKERS, cancel_event)
+        if block is None:
+            print("⛏️ Mining cancelled")
+            return
+        self._chain_executor.submit(self._on_block_mined, block)
+
+    def _on_block_mined(self, block: Block):
+        if block.previous_hash != self.blockchain.tip_hash:
+            print(f"⛏️ Mined block #{block.index} is stale, dropping it")
+            return
+        self.blockchain.pending_txs.remove_confirmed(block.transactions)
+        self.message_queue.put({
+            MessageField.TYPE: MessageType.BLOCK,
             MessageField.DATA: block.to_dict()
         })
 
-    def _rebroadcast_block(self, block: Block):
-        self._broadcast({
-            MessageField.TYPE: MessageType.REBROADCAST,
+    def _receive_block(self, block: Block):
+        block_hash = block.hash()
+        if block.previous_hash != self.blockchain.tip_hash or self._find_block(block_hash) is not None:
+            return
+        if not self._is_valid_block(block):
+            print(f"❌ Block {block_hash[:8]} did not pass validation")
+            return
+        self._announce(block_hashes=[block_hash])
+        if block_hash == self._finalising_hash:
+            self.verify_and_add_block(block)
+            return
+
+        self._set_stage(Stage.MINING)
+        self._register_pending_block(block_hash, block)
+        self._rebroadcast_block(block)
+        self.message_queue.put(self._vote_message(MessageType.REBROADCAST, block_hash))
+
+    def _handle_compact_block(self, peer: tuple[str, int], compact: CompactBlock):
+        block_hash = compact.hash()
+        self._requested.complete(block_hash)
+        self._known_inventory.mark(peer, [block_hash])
+        if self._find_block(block_hash) is not None:
+            return
+
+        partial = compact.reconstruct(self.blockchain.pending_txs)
+        missing = partial.missing()
+        block = None if missing else partial.to_block()
+        if block is not None:
+            self._receive_block(block)
+            return
+
+        if not missing:
+            print(f"⚠️ Compact block {block_hash[:8]} did not rebuild, fetching all its transactions")
+            missing = [i for i in range(len(partial.transactions)) if i not in dict(compact.prefilled)]
+        self._partial_blocks[block_hash] = (peer, partial)
+        self._send_to_peer(peer, {
+            MessageField.TYPE: MessageType.GET_BLOCK_TXN,
             MessageField.DATA: {
-                RebroadcastField.HOST: self._external_ip,
-                RebroadcastField.PORT: self._port,
-                RebroadcastField.BLOCK: block.to_dict()
-            },
+                BlockTxnField.HOST: self._external_ip,
+                BlockTxnField.PORT: self._port,
+                BlockTxnField.BLOCK_HASH: block_hash,
+                BlockTxnField.INDEXES: missing
+            }
         })
 
-    def _broadcast_request_chain(self):
-        self._broadcast({
-            MessageField.TYPE: MessageType.REQUEST_CHAIN
+    def _handle_block_txn(self, peer: tuple[str, int], block_hash: str, indexes: list[int], txs: list[Transaction]):
+        expected_peer, partial = self._partial_blocks.get(block_hash, (None, None))
+        if partial is None or expected_peer != peer:
+            return
+        del self._partial_blocks[block_hash]
+        partial.fill(indexes, txs)
+        block = partial.to_block()
+        if block is None:
+            print(f"❌ Could not rebuild block {block_hash[:8]} from {peer}")
+            return
+        self._receive_block(block)
+
+    def _send_block_txn(self, peer: tuple[str, int], block_hash: str, indexes: list[int], txs: list[Transaction]):
+        self._send_to_peer(peer, {
+            MessageField.TYPE: MessageType.BLOCK_TXN,
+            MessageField.DATA: {
+                BlockTxnField.HOST: self._external_ip,
+                BlockTxnField.PORT: self._port,
+                BlockTxnField.BLOCK_HASH: block_hash,
+                BlockTxnField.INDEXES: indexes,
+                BlockTxnField.TXS: [tx.to_dict() for tx in txs]
+            }
+        })
+
+    def _find_block(self, block_hash: str) -> Block | None:
+        if self.light:
+            return None
+        with self._block_lock:
+            pending = self._pending_blocks.get(block_hash)
+        if pending is not None and pending[0] is not None:
+            return pending[0]
+        height = self.blockchain.get_height(block_hash)
+        return self.blockchain.get_block(height) if height is not None else None
+
+    def _announce(self, tx_hashes: list[str] | None = None, block_hashes: list[str] | None = None):
+        tx_hashes, block_hashes = tx_hashes or [], block_hashes or []
+        for peer in self._full_peers():
+            unseen_txs = self._known_inventory.unseen(peer, tx_hashes)
+            unseen_blocks = self._known_inventory.unseen(peer, block_hashes)
+            if unseen_txs or unseen_blocks:
+                self._known_inventory.mark(peer, unseen_txs + unseen_blocks)
+                self._send_inventory(peer, MessageType.INV, unseen_txs, unseen_blocks)
+
+    def _request_data(self, peer: tuple[str, int], tx_hashes: list[str], block_hashes: list[str]):
+        if tx_hashes or block_hashes:
+            self._send_inventory(peer, MessageType.GET_DATA, tx_hashes, block_hashes)
+
+    def _send_data(self, peer: tuple[str, int], tx_hashes: list[str], block_hashes: list[str]):
+        for txid in tx_hashes:
+            tx = self.blockchain.pending_txs.get(txid)
+            if tx is not None:
+                self._known_inventory.mark(peer, [txid])
+                self._send_to_peer(peer, {MessageField.TYPE: MessageType.TX, MessageField.DATA: tx.to_dict()})
+        for block_hash in block_hashes:
+            block = self._find_block(block_hash)
+            if block is not None:
+                self._known_inventory.mark(peer, [block_hash])
+                self._send_to_peer(peer, {
+                    MessageField.TYPE: MessageType.COMPACT_BLOCK,
+                    MessageField.DATA: {
+                        CompactBlockField.HOST: self._external_ip,
+                        CompactBlockField.PORT: self._port,
+                        CompactBlockField.BLOCK: CompactBlock.from_block(block).to_dict()
+                    }
+                })
+
+    def _send_inventory(self, peer: tuple[str, int], msg_type: str, tx_hashes: list[str], block_hashes: list[str]):
+        self._send_to_peer(peer, {
+            MessageField.TYPE: msg_type,
+            MessageField.DATA: {
+                InventoryField.HOST: self._external_ip,
+                InventoryField.PORT: self._port,
+                InventoryField.TXS: tx_hashes,
+                InventoryField.BLOCKS: block_hashes
+            }
+        })
+
+    def _handle_headers(self, peer: tuple[str, int], headers: list[BlockHeader]):
+        if not headers:
+            return
+        if self.light:
+            if self.blockchain.add_headers(headers) and len(headers) == Constants.MAX_HEADERS_PER_MESSAGE:
+                self._request_headers(peer)
+            return
+        if not self.blockchain.connects_headers(headers):
+            print(f"❌ Headers from {peer} do not connect to our chain")
+            return
+        if headers[-1].index < len(self.blockchain.chain):
+            return
+
+        self._syncs[peer] = [[], len(headers) == Constants.MAX_HEADERS_PER_MESSAGE]
+        self._send_to_peer(peer, {
+            MessageField.TYPE: MessageType.GET_BLOCKS,
+            MessageField.DATA: {
+                SyncField.HOST: self._external_ip,
+                SyncField.PORT: self._port,
+                SyncField.START: headers[0].index,
+                SyncField.END: headers[-1].index
+            }
         })
 
+    def _connect_synced_blocks(self, sync: list, blocks: list[Block]) -> bool:
+        # Chunks extending our tip are validated and connected as they stream in; only a fork is buffered
+        if sync[0] or not blocks or blocks[0].previous_hash != self.blockchain.tip_hash:
+            return False
+        connected = []
+        for block in blocks:
+            if not self.blockchain.add_block(block):
+                print(f"❌ Synced block #{block.index} is invalid")
+                sync[1] = False
+                break
+            connected.append(block)
+        if connected:
+            self._clear_pending_blocks()
+            self._notify_subscribers(connected)
+        return True
+
+    def _apply_synced_blocks(self, peer: tuple[str, int]):
+        blocks, more_headers = self._syncs.pop(peer)
+        if blocks:
+            fork_height = blocks[0].index - 1
+            if self.blockchain.try_to_update_chain(self.blockchain.headers[:fork_height + 1] + blocks):
+                self._clear_pending_blocks()
+                self._notify_subscribers(blocks)
+        if more_headers:
+            self._request_headers(peer)
+
+    def _subscribe(self, peer: tuple[str, int]):
+        self._send_to_peer(peer, {
+            MessageField.TYPE: MessageType.SUBSCRIBE,
+            MessageField.DATA: {
+                SubscribeField.HOST: self._external_ip,
+                SubscribeField.PORT: self._port,
+                SubscribeField.ADDRESSES: [self.address],
+                SubscribeField.FROM_HEIGHT: 0
+            }
+        })
+
+    def _notify_subscribers(self, blocks: list[Block]):
+        for peer in list(self._subscriptions):
+            for block in blocks:
+                self._send_merkle_block(peer, block, only_matches=False)
+
+    def _send_merkle_block(self, peer: tuple[str, int], block: Block, only_matches: bool):
+        # Live blocks always go out so the light node learns the header; rescans skip blocks without matches
+        addresses = self._subscriptions.get(peer, set())
+        matches = [(index, tx) for index, tx in enumerate(block.transactions) if matches_addresses(tx, addresses)]
+        if only_matches and not matches:
+            return
+        self._send_to_peer(peer, {
+            MessageField.TYPE: MessageType.MERKLE_BLOCK,
+            MessageField.DATA: {
+                MerkleBlockField.HOST: self._external_ip,
+                MerkleBlockField.PORT: self._port,
+                MerkleBlockField.HEADER: block.header().to_dict(),
+                MerkleBlockField.TX_COUNT: len(block.transactions),
+                MerkleBlockField.MATCHES: [{
+                    MerkleBlockField.TX: tx.to_dict(),
+                    MerkleBlockField.INDEX: index,
+                    MerkleBlockField.PROOF: block.tx_proof(tx.hash())[1]
+                } for index, tx in matches]
+            }
+        })
+
+    def _send_headers(self, peer: tuple[str, int], headers: list[BlockHeader]):
+        self._send_to_peer(peer, {
+            MessageField.TYPE: MessageType.HEADERS,
+            MessageField.DATA: {
+                SyncField.HOST: self._external_ip,
+                SyncField.PORT: self._port,
+                SyncField.HEADERS: [header.to_dict() for header in headers]
+            }
+        })
+
+    def _send_blocks(self, peer: tuple[str, int], start: int, end: int):
+        end = min(end, len(self.blockchain.chain) - 1)
+        for chunk_start in range(start, end + 1, Constants.MAX_BLOCKS_PER_MESSAGE):
+            chunk_end = min(chunk_start + Constants.MAX_BLOCKS_PER_MESSAGE - 1, end)
+            self._send_to_peer(peer, {
+                MessageField.TYPE: MessageType.BLOCKS,
+                MessageField.DATA: {
+                    SyncField.HOST: self._external_ip,
+                    SyncField.PORT: self._port,
+                    SyncField.BLOCKS: [block.to_dict() for block in self.blockchain.get_blocks(chunk_start, chunk_end)],
+                    SyncField.LAST: chunk_end == end
+                }
+            })
+
+    def _get_headers_message(self) -> dict:
+        return {
+            MessageField.TYPE: MessageType.GET_HEADERS,
+            MessageField.DATA: {
+                SyncField.HOST: self._external_ip,
+                SyncField.PORT: self._port,
+                SyncField.LOCATOR: self.blockchain.get_locator()
+            }
+        }
+
+    def _request_headers(self, peer: tuple[str, int]):
+        self._send_to_peer(peer, self._get_headers_message())
+
+    def _finalize_block(self, block: Block):
+        self._broadcast(self._vote_message(MessageType.FINALISE_BLOCK, block.hash()))
+
+    def _rebroadcast_block(self, block: Block):
+        self._broadcast(self._vote_message(MessageType.REBROADCAST, block.hash()))
+
+    def _broadcast_request_chain(self):
+        self._broadcast(self._get_headers_message())
+
     def _broadcast_disconnect(self):
         self._broadcast({
             MessageField.TYPE: MessageType.DISCONNECT,
@@ -247,81 +674,127 @@ class Node:
             }
         })
 
-    def _broadcast(self, message: dict):
-        raw = json.dumps(message).encode()
-        for peer in self.peers.copy():
-            try:
-                with socket.socket() as s:
-                    s.connect(peer)
-                    s.send(raw)
-            except Exception as e:
-                print(f"❌ Failed to send {message['type']} → {peer}: {e}")
+    def _send_hello(self, peer: tuple[str, int], ack: bool):
+        self._send_to_peer(peer, {
+            MessageField.TYPE: MessageType.HELLO,
+            MessageField.DATA: {
+                HelloField.HOST: self._external_ip,
+                HelloField.PORT: self._port,
+                HelloField.FORMATS: wire_format.SUPPORTED_FORMATS,
+                HelloField.ACK: ack,
+                HelloField.LIGHT: self.light
+            }
+        })
 
-    def _broadcast_chain(self):
-        self._broadcast({
-            MessageField.TYPE: MessageType.CHAIN,
-            MessageField.DATA: self.blockchain.to_dict()})
+    def _get_wire_format(self, peer: tuple[str, int]) -> str:
+        return self._peer_formats.get(peer, wire_format.JSON_FORMAT)
 
-    def broadcast_transaction(self, tx: Transaction):
-        self._broadcast({
-            MessageField.TYPE: MessageType.TX,
-            MessageField.DATA: tx.to_dict()
-        })
+    def _full_peers(self) -> set[tuple[str, int]]:
+        return self.peers - self._light_peers
 
-    def _broadcast_block(self, block):
-        self._broadcast({
-            MessageField.TYPE: MessageType.BLOCK,
-            MessageField.DATA: block.to_dict()
-        })
+    def _broadcast(self, message: dict):
+        # Light peers only care about disconnects; block and transaction gossip skips them
+        peers = self.peers.copy() if message[MessageField.TYPE] == MessageType.DISCONNECT else self._full_peers()
+        encoded: dict[str, bytes] = {}
+        for peer in peers:
+            peer_format = self._get_wire_format(peer)
+            if peer_format not in encoded:
+                encoded[peer_format] = wire_format.encode(message, peer_format)
+            self._send_raw(peer, encoded[peer_format], message[MessageField.TYPE])
+
+    def _send_to_peer(self, peer: tuple[str, int], message: dict):
+        raw = wire_format.encode(message, self._get_wire_format(peer))
+        self._send_raw(peer, raw, message[MessageField.TYPE])
+
+    def _send_raw(self, peer: tuple[str, int], raw: bytes, msg_type: str):
+        self._loop.call_soon_threadsafe(self._enqueue_raw, peer, raw, msg_type)
+
+    def _enqueue_raw(self, peer: tuple[str, int], raw: bytes, msg_type: str):
+        connection = self._connections.get(peer)
+        if connection is None:
+            connection = self._connections[peer] = PeerConnection(peer)
+        if not connection.send(raw):
+            print(f"❌ Failed to send {msg_type} → {peer}")
+
+    async def _close_connection(self, peer: tuple[str, int]):
+        connection = self._connections.pop(peer, None)
+        if connection is not None:
+            await connection.close()
+
+    def broadcast_transaction(self, tx: Transaction):
+        self._announce(tx_hashes=[tx.hash()])
 
     def add_and_broadcast_tx(self, tx: Transaction) -> bool:
+        return self._chain_executor.submit(self._add_and_broadcast_tx, tx).result()
+
+    # Reads for the menu and research threads; the chain and mempool are only touched on the chain executor
+    def get_spendable_outputs(self, address: str) -> list[tuple[str, int, TxOutput]]:
+        return self._chain_executor.submit(self.blockchain.get_spendable_outputs, address).result()
+
+    def get_tip_block(self) -> Block:
+        return self._chain_executor.submit(self.blockchain.get_block, -1).result()
+
+    def print_chain(self):
+        self._chain_executor.submit(self.blockchain.print_chain).result()
+
+    def _add_and_broadcast_tx(self, tx: Transaction) -> bool:
         if self.get_stage() == Stage.TX and self.blockchain.add_transaction(tx):
             self.broadcast_transaction(tx)
             return True
         return False
 
-    def _listen_discovery(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.bind(('', self._discovery_port))
-        while True:
-            data, addr = sock.recvfrom(1024)
-            if data == b"DISCOVER":
-                response = f"{self._external_ip}:{self._port}"
-                sock.sendto(response.encode(), addr)
+    async def _listen_discovery(self):
+        await self._loop.create_datagram_endpoint(lambda: _DatagramProtocol(self._on_discovery_request),
+                                                  local_addr=('', self._discovery_port))
+
+    def _on_discovery_request(self, transport, data, addr):
+        if data == b"DISCOVER":
+            response = f"{self._external_ip}:{self._port}"
+            transport.sendto(response.encode(), addr)
+
+    def _schedule_mining_round(self):
+        self._loop.call_soon_threadsafe(self._loop.call_later, Constants.TIME_TO_SLEEP, self._broadcast_mining)
 
     def _broadcast_mining(self):
-        time.sleep(Constants.TIME_TO_SLEEP)
         if self._is_leader():
             message = {MessageField.TYPE: MessageType.MINING}
             self._broadcast(message)
             if self.role == Role.MINER:
                 self.message_queue.put(message)
 
-    def _broadcast_presence(self):
-        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    async def _broadcast_presence(self):
+        transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: _DatagramProtocol(self._on_discovery_response), family=socket.AF_INET, allow_broadcast=True)
         while True:
             try:
-                sock.sendto(b"DISCOVER", ('<broadcast>', self._discovery_port))
-                sock.settimeout(1.0)
-                while True:
-                    try:
-                        data, addr = sock.recvfrom(1024)
-                        peer_host, peer_port = data.decode().split(":")
-                        if peer_host == self._external_ip and int(peer_port) == self._port:
-                            continue
-                        peer = (peer_host, int(peer_port))
-                        self.peers.add(peer)
-
-                        if len(self.blockchain.chain) == 1:
-                            self._broadcast_request_chain()
-                    except socket.timeout:
-                        break
+                transport.sendto(b"DISCOVER", ('<broadcast>', self._discovery_port))
             except Exception as e:
                 print("Error during UDP discovery:", e)
-            time.sleep(5)
+            await asyncio.sleep(5)
+
+    def _on_discovery_response(self, transport, data, addr):
+        try:
+            peer_host, peer_port = data.decode().split(":")
+            peer = (peer_host, int(peer_port))
+        except ValueError as e:
+            print("Error during UDP discovery:", e)
+            return
+        if peer_host == self._external_ip and peer[1] == self._port:
+            return
+        self._chain_executor.submit(self._add_peer, peer)
+
+    def _add_peer(self, peer: tuple[str, int]):
+        if peer not in self.peers:
+            self._send_hello(peer, ack=False)
+            if self.light:
+                self._subscribe(peer)
+        if peer not in self.peers or len(self.blockchain.chain) == 1:
+            self.peers.add(peer)
+            self._request_headers(peer)
 
     def _is_leader(self) -> bool:
+        if self.light:
+            return False
         my_id = f"{self._external_ip}:{self._port}"
-        peer_ids = [f"{host}:{port}" for (host, port) in self.peers]
+        peer_ids = [f"{host}:{port}" for (host, port) in self._full_peers()]
         return my_id == min([my_id] + peer_ids)
\ No newline at end of file
@@ -0,0 +1,92 @@
+import asyncio
+import struct
+
+from constants import Constants
+
+_FRAME_HEADER = struct.Struct(">I")
+
+
+async def write_frame(writer: asyncio.StreamWriter, payload: bytes) -> None:
+    writer.write(_FRAME_HEADER.pack(len(payload)) + payload)
+    await writer.drain()
+
+
+async def read_frame(reader: asyncio.StreamReader) -> bytes | None:
+    try:
+        header = await reader.readexactly(_FRAME_HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            return None
+        raise ConnectionError("Connection closed in the middle of a frame header")
+    (length,) = _FRAME_HEADER.unpack(header)
+    if length > Constants.MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {length} bytes exceeds the limit")
+    try:
+        return await reader.readexactly(length)
+    except asyncio.IncompleteReadError:
+        raise ConnectionError("Connection closed in the middle of a frame")
+
+
+class PeerConnection:
+    # Must be created and used from inside the event loop that owns it
+    def __init__(self, peer: tuple[str, int]) -> None:
+        self.peer = peer
+        self._queue: asyncio.Queue[bytes] = asyncio.Queue(maxsize=Constants.PEER_SEND_QUEUE_SIZE)
+        self._writer: asyncio.StreamWriter | None = None
+        self._backoff = Constants.RECONNECT_BACKOFF_MIN
+        self._closed = False
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def send(self, payload: bytes) -> bool:
+        if self._closed:
+            return False
+        try:
+            self._queue.put_nowait(payload)
+            return True
+        except asyncio.QueueFull:
+            print(f"❌ Send queue to {self.peer} is full, dropping message")
+            return False
+
+    async def close(self, timeout: float = 0) -> None:
+        # Gives queued messages up to `timeout` seconds to go out before closing
+        self._closed = True
+        if timeout > 0:
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._disconnect()
+
+    async def _run(self) -> None:
+        while True:
+            payload = await self._queue.get()
+            try:
+                await self._deliver(payload)
+            finally:
+                self._queue.task_done()
+
+    async def _deliver(self, payload: bytes) -> None:
+        for _ in range(Constants.MAX_SEND_ATTEMPTS):
+            try:
+                if self._writer is None:
+                    _, self._writer = await asyncio.wait_for(asyncio.open_connection(*self.peer),
+                                                             Constants.CONNECT_TIMEOUT)
+                await write_frame(self._writer, payload)
+                self._backoff = Constants.RECONNECT_BACKOFF_MIN
+                return
+            except (OSError, asyncio.TimeoutError) as e:
+                print(f"❌ Connection to {self.peer} failed: {e}, retrying in {self._backoff:.1f}s")
+                self._disconnect()
+                await asyncio.sleep(self._backoff)
+                self._backoff = min(self._backoff * 2, Constants.RECONNECT_BACKOFF_MAX)
+        print(f"❌ Dropping message to {self.peer} after {Constants.MAX_SEND_ATTEMPTS} attempts")
+
+    def _disconnect(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
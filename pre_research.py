@@ -1,5 +1,4 @@
-import json
-
+from chain_stream import write_chain
 from constants import Role, Constants, MetadataType
 from node import Node
 from transaction import Transaction, TxOutput
@@ -16,13 +15,12 @@ def prepare_miner(node: Node, amount_of_blocks: int, amount_of_tx_in_block: int)
                                  "number_of_block": i + 1,
                                  "number_of_tx": j + 1,
                                })
-            node.blockchain.pending_txs.append(tx)
+            node.blockchain.pending_txs.add(tx)
         new_block = node.blockchain.mine_block(node.address)
         node.verify_and_add_block(new_block)
         print(f"Block #{i} added")
 
-    with open(f"research_files/blockchain.json", "w") as f:
-        json.dump(node.blockchain.to_dict(), f, indent=2)
+    write_chain("research_files/blockchain.jsonl", node.blockchain.chain)
 
 if __name__ == "__main__":
     role = Role.MINER
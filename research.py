@@ -1,4 +1,3 @@
-import json
 import random
 import statistics
 import sys
@@ -7,8 +6,8 @@ from concurrent.futures import ThreadPoolExecutor
 
 import numpy as np
 
+from chain_stream import import_chain, read_chain
 from constants import Role, Stage, Constants
-from deserialize_service import DeserializeService
 from main import choose_port, create_transaction
 from node import Node
 from wallet import load_wallet, pubkey_to_address, get_public_key
@@ -35,7 +34,7 @@ def start_research(node: Node, addresses: list[str]) -> None:
         if len(node.blockchain.chain) - old_amount_of_blocks == 1:
             old_amount_of_blocks = len(node.blockchain.chain)
 
-            for tx in node.blockchain.chain[-1].transactions:
+            for tx in node.get_tip_block().transactions:
                 tx_id = tx.hash()
                 if tx_id in tx_submit_time:
                     latency = time.time() - tx_submit_time[tx_id]
@@ -123,12 +122,8 @@ def get_addresses() -> list[str]:
     return [pubkey_to_address(get_public_key(pr_key)) for pr_key in pr_keys]
 
 def prepare_miner(node: Node):
-    with open("research_files/blockchain.json", "r") as f:
-        blockchain_data = json.load(f)
-        blocks = DeserializeService.deserialize_chain(blockchain_data)
-        node.blockchain.chain = blocks
-
-    node.blockchain.rebuild_utxo_set()
+    if not import_chain(node.blockchain, read_chain("research_files/blockchain.jsonl")):
+        print("❌ The research chain was only partly imported")
 
 def show_menu(node: Node):
     addresses: list[str] = get_addresses()
@@ -145,7 +140,7 @@ def show_menu(node: Node):
             print("Research finished")
 
         elif choice == "4":
-            node.blockchain.print_chain()
+            node.print_chain()
 
         elif choice == "0":
             node.disconnect()
@@ -2,21 +2,78 @@ import hashlib
 import json
 import ecdsa
 import base64
+from types import MappingProxyType
 
 from constants import TxInputField, TxOutputField, MetadataType, TxField
+from verification import owns_address, verify_signature
+
+
+def pack_hex(value: str) -> bytes | str:
+    # Hashes and addresses are held as raw bytes; values that would not round-trip stay as given
+    if len(value) == 64:
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            return value
+        if raw.hex() == value:
+            return raw
+    return value
+
+
+def unpack_hex(value: bytes | str) -> str:
+    return value.hex() if isinstance(value, bytes) else value
+
+
+def pack_base64(value: str) -> bytes | str:
+    try:
+        raw = base64.b64decode(value, validate=True)
+    except ValueError:
+        return value
+    return raw if base64.b64encode(raw).decode() == value else value
+
+
+def unpack_base64(value: bytes | str) -> str:
+    return base64.b64encode(value).decode() if isinstance(value, bytes) else value
 
 
 class TxInput:
+    # The outpoint is part of the txid and fixed once built; signature and pubkey are not, so signing may set them later
+    __slots__ = ("_tx_id", "_index", "_signature", "_pubkey")
+
     def __init__(self,
                  tx_id: str,
                  index: int,
                  signature: str = "",
                  pubkey: str = "") -> None:
-        self.tx_id = tx_id  # ID of last transaction
-        self.index = index  # index of output
+        self._tx_id = pack_hex(tx_id)  # ID of last transaction
+        self._index = index  # index of output
         self.signature = signature
         self.pubkey = pubkey
 
+    @property
+    def tx_id(self) -> str:
+        return unpack_hex(self._tx_id)
+
+    @property
+    def index(self) -> int:
+        return self._index
+
+    @property
+    def signature(self) -> str:
+        return unpack_base64(self._signature)
+
+    @signature.setter
+    def signature(self, signature: str) -> None:
+        self._signature = pack_base64(signature)
+
+    @property
+    def pubkey(self) -> str:
+        return unpack_base64(self._pubkey)
+
+    @pubkey.setter
+    def pubkey(self, pubkey: str) -> None:
+        self._pubkey = pack_base64(pubkey)
+
     def to_dict(self) -> dict:
         return {
             TxInputField.TX_ID: self.tx_id,
@@ -27,11 +84,26 @@ class TxInput:
 
 
 class TxOutput:
+    __slots__ = ("_amount", "_address")
+
     def __init__(self,
                  amount: int,
                  address: str) -> None:
-        self.amount = amount
-        self.address = address  # address of receiver
+        self._amount = amount
+        self._address = pack_hex(address)  # address of receiver
+
+    @property
+    def amount(self) -> int:
+        return self._amount
+
+    @property
+    def address(self) -> str:
+        return unpack_hex(self._address)
+
+    @property
+    def address_key(self) -> bytes | str:
+        # Packed address, shared with indexes so they do not hold a second copy
+        return self._address
 
     def to_dict(self) -> dict:
         return {
@@ -41,16 +113,32 @@ class TxOutput:
 
 
 class Transaction:
+    __slots__ = ("_hash", "_inputs", "_outputs", "_metadata")
+
     def __init__(self,
                  inputs: list[TxInput],
                  outputs: list[TxOutput],
                  metadata: dict = None) -> None:
-        self.inputs = inputs
-        self.outputs = outputs
-        self.metadata = metadata or {}
+        # Everything the txid covers is read-only, so the cached hash cannot go stale
+        self._hash = None
+        self._inputs = tuple(inputs)
+        self._outputs = tuple(outputs)
+        self._metadata = dict(metadata or {})
+
+    @property
+    def inputs(self) -> tuple[TxInput, ...]:
+        return self._inputs
+
+    @property
+    def outputs(self) -> tuple[TxOutput, ...]:
+        return self._outputs
+
+    @property
+    def metadata(self) -> MappingProxyType:
+        return MappingProxyType(self._metadata)
 
     def is_coinbase(self) -> bool:
-        return MetadataType.HEIGHT in self.metadata
+        return MetadataType.HEIGHT in self._metadata
 
     def to_dict(self, include_signatures=True) -> dict:
         return {
@@ -59,15 +147,21 @@ class Transaction:
                 TxInputField.INDEX: i.index
             } for i in self.inputs],
             TxField.OUTPUTS: [o.to_dict() for o in self.outputs],
-            TxField.METADATA: self.metadata
+            TxField.METADATA: self._metadata
         }
 
     def to_json(self, include_signatures=True) -> str:
         return json.dumps(self.to_dict(include_signatures), sort_keys=True)
 
     def hash(self) -> str:
-        tx_str = self.to_json(include_signatures=False)
-        return hashlib.sha256(tx_str.encode()).hexdigest()
+        if self._hash is None:
+            tx_str = self.to_json(include_signatures=False)
+            self._hash = hashlib.sha256(tx_str.encode()).hexdigest()
+        return self._hash
+
+    def signature_items(self) -> list[tuple[str, int, str, str]]:
+        txid = self.hash()
+        return [(txid, i, txin.signature, txin.pubkey) for i, txin in enumerate(self.inputs)]
 
     def sign_input(self, index: int, privkey_wif: str) -> None:
         sk = ecdsa.SigningKey.from_string(base64.b64decode(privkey_wif), curve=ecdsa.SECP256k1)
@@ -76,30 +170,23 @@ class Transaction:
         self.inputs[index].signature = base64.b64encode(signature).decode()
         self.inputs[index].pubkey = base64.b64encode(sk.get_verifying_key().to_string()).decode()
 
-    def is_valid(self, utxo_set: dict[str, dict[int, TxOutput]]) -> bool:
+    def is_valid(self, utxo_set) -> bool:
         input_sum = 0
         output_sum = 0
 
         for i, txin in enumerate(self.inputs):
-            if txin.tx_id not in utxo_set or txin.index not in utxo_set[txin.tx_id]:
+            utxo = utxo_set.get_output(txin.tx_id, txin.index)
+            if utxo is None:
                 print("Invalid input: missing UTXO")
                 return False
 
-            utxo = utxo_set[txin.tx_id][txin.index]
             input_sum += utxo.amount
 
-            pubkey_bytes = base64.b64decode(txin.pubkey)
-            signature = base64.b64decode(txin.signature)
-            vk = ecdsa.VerifyingKey.from_string(pubkey_bytes, curve=ecdsa.SECP256k1)
-
-            try:
-                vk.verify(signature, self.hash().encode())
-            except ecdsa.BadSignatureError:
+            if not verify_signature((self.hash(), i, txin.signature, txin.pubkey)):
                 print("Invalid signature")
                 return False
 
-            derived_address = hashlib.sha256(pubkey_bytes).hexdigest()
-            if utxo.address != derived_address:
+            if not owns_address(txin.pubkey, utxo.address):
                 print("Public key does not match address")
                 return False
 
@@ -1,6 +1,31 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+
 import pytest
-from blockchain import Blockchain, Block
-from transaction import Transaction, TxInput, TxOutput
+
+import verification
+import wire_format
+from block_store import BlockStore
+from chain_stream import import_chain, read_chain, write_chain
+from compact_block import CompactBlock
+from blockchain import Blockchain, Block, BlockHeader
+from constants import Constants, MessageType, Role
+from deserialize_service import DeserializeService
+from inventory import PeerInventory, RequestTracker
+from light_client import LightChain
+from mempool import Mempool
+from merkle import MerkleTree, verify_proof
+from message_queue import MessageQueue, MessageMetrics
+from miner import find_nonce
+from node import Node
+from peer_connection import PeerConnection, read_frame
+from transaction import Transaction, TxInput, TxOutput, create_coinbase_tx
+from utxo_set import UtxoSet, UtxoView
+from verification import signature_cache, verify_batch
+from wallet import generate_keypair, pubkey_to_address, save_wallet
 
 
 @pytest.fixture
@@ -8,6 +33,18 @@ def blockchain():
     return Blockchain()
 
 
+@pytest.fixture
+def alice():
+    privkey, pubkey = generate_keypair()
+    return privkey, pubkey_to_address(pubkey)
+
+
+def _signed(tx: Transaction, privkey: str) -> Transaction:
+    for i in range(len(tx.inputs)):
+        tx.sign_input(i, privkey)
+    return tx
+
+
 def test_create_genesis_block(blockchain):
     genesis = blockchain.chain[0]
     assert genesis.index == 0
@@ -22,22 +59,24 @@ def test_mine_block_contains_coinbase(blockchain):
     assert coinbase_tx.outputs[0].address == "miner1"
 
 
-def test_add_valid_transaction(blockchain):
-    cb = Transaction([], [TxOutput(100, "alice")])
+def test_add_valid_transaction(blockchain, alice):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address)])
     blockchain.chain.append(Block(1, blockchain.chain[-1].hash(), [cb]))
     blockchain.rebuild_utxo_set()
 
-    tx = Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(60, "bob"), TxOutput(40, "alice")])
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(60, "bob"), TxOutput(40, address)]), privkey)
     assert blockchain.add_transaction(tx) is True
     assert tx in blockchain.pending_txs
 
 
-def test_duplicate_transaction_fails(blockchain):
-    cb = Transaction([], [TxOutput(100, "alice")])
+def test_duplicate_transaction_fails(blockchain, alice):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address)])
     blockchain.chain.append(Block(1, blockchain.chain[-1].hash(), [cb]))
     blockchain.rebuild_utxo_set()
 
-    tx = Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")])
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")]), privkey)
     blockchain.add_transaction(tx)
     assert blockchain.add_transaction(tx) is False
 
@@ -65,12 +104,13 @@ def test_get_balance(blockchain):
     assert blockchain.get_balance("bob") == 0.0
 
 
-def test_valid_block_passes_validation(blockchain):
-    cb = Transaction([], [TxOutput(100, "alice")])
+def test_valid_block_passes_validation(blockchain, alice):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address)])
     blockchain.chain.append(Block(1, blockchain.chain[-1].hash(), [cb]))
     blockchain.rebuild_utxo_set()
 
-    tx = Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(70, "bob"), TxOutput(30, "alice")])
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(70, "bob"), TxOutput(30, address)]), privkey)
     block = Block(2, blockchain.chain[-1].hash(), [tx])
     assert blockchain.validate_block(block) is True
 
@@ -82,10 +122,923 @@ def test_add_block_invalid_prev_hash(blockchain):
 
 def test_try_to_update_chain(blockchain):
     new_chain = [blockchain.chain[0]]
-    cb = Transaction([], [TxOutput(100, "alice")])
+    cb = Transaction([], [TxOutput(100, "alice")], {"height": 1})
     new_block = Block(1, blockchain.chain[0].hash(), [cb])
     new_chain.append(new_block)
 
     blockchain.try_to_update_chain(new_chain)
     assert len(blockchain.chain) == 2
     assert blockchain.get_balance("alice") == 100
+
+
+def test_balance_index_follows_spends(blockchain):
+    cb = Transaction([], [TxOutput(100, "alice")])
+    blockchain.chain.append(Block(1, blockchain.chain[-1].hash(), [cb]))
+    tx = Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(60, "bob"), TxOutput(40, "alice")])
+    blockchain.chain.append(Block(2, blockchain.chain[-1].hash(), [tx]))
+    blockchain.rebuild_utxo_set()
+
+    assert blockchain.get_balance("alice") == 40
+    assert blockchain.get_balance("bob") == 60
+    assert [(txid, index) for txid, index, _ in blockchain.utxo_set.outputs_of("alice")] == [(tx.hash(), 1)]
+
+
+def test_spendable_outputs_exclude_pending_spends(blockchain, alice):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address), TxOutput(20, address)])
+    blockchain.chain.append(Block(1, blockchain.chain[-1].hash(), [cb]))
+    blockchain.rebuild_utxo_set()
+
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")]), privkey)
+    blockchain.add_transaction(tx)
+
+    spendable = blockchain.get_spendable_outputs(address)
+    assert [(txid, index) for txid, index, _ in spendable] == [(cb.hash(), 1)]
+
+
+def test_validate_block_leaves_utxo_set_untouched_until_added(blockchain, alice):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address)])
+    blockchain.chain.append(Block(1, blockchain.chain[-1].hash(), [cb]))
+    blockchain.rebuild_utxo_set()
+
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(70, "bob"), TxOutput(30, address)]), privkey)
+    block = Block(2, blockchain.chain[-1].hash(), [tx])
+
+    assert blockchain.validate_block(block) is True
+    assert blockchain.get_balance(address) == 100
+    assert blockchain.add_block(block) is True
+    assert blockchain.get_balance(address) == 30
+    assert blockchain.get_balance("bob") == 70
+    assert blockchain.utxo_set.get_output(cb.hash(), 0) is None
+
+
+def test_utxo_view_overlays_base_set():
+    base = UtxoSet()
+    base.add_output("a" * 64, 0, TxOutput(10, "alice"))
+    view = UtxoView(base)
+
+    assert view.spend_output("a" * 64, 0).amount == 10
+    view.add_output("b" * 64, 0, TxOutput(10, "bob"))
+    assert view.get_output("a" * 64, 0) is None
+    assert base.get_output("a" * 64, 0) is not None
+    assert view.get_balance("bob") == 10
+
+    view.commit()
+    assert base.get_balance("alice") == 0
+    assert base.get_balance("bob") == 10
+
+
+def test_add_block_credits_coinbase(blockchain):
+    block = blockchain.mine_block("miner1")
+    assert blockchain.add_block(block) is True
+    assert blockchain.get_balance("miner1") == 50
+
+
+def test_transaction_hash_cannot_go_stale():
+    tx = Transaction([TxInput("a" * 64, 0)], [TxOutput(10, "bob")])
+    txid = tx.hash()
+
+    tx.inputs[0].signature = "signature"
+    assert tx.hash() == txid
+
+    with pytest.raises(AttributeError):
+        tx.outputs = [TxOutput(11, "bob")]
+    with pytest.raises(AttributeError):
+        tx.outputs[0].amount = 11
+    with pytest.raises(AttributeError):
+        tx.inputs[0].tx_id = "b" * 64
+    with pytest.raises(TypeError):
+        tx.outputs[0] = TxOutput(11, "bob")
+    with pytest.raises(TypeError):
+        tx.metadata["note"] = "x"
+    assert tx.hash() == txid
+
+
+def test_conflicting_transaction_is_rejected(blockchain, alice):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address)])
+    blockchain.chain.append(Block(1, blockchain.chain[-1].hash(), [cb]))
+    blockchain.rebuild_utxo_set()
+
+    tx1 = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")]), privkey)
+    tx2 = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "carol")]), privkey)
+    assert blockchain.add_transaction(tx1) is True
+    assert blockchain.add_transaction(tx2) is False
+    assert blockchain.pending_txs.get_spender(cb.hash(), 0) == tx1.hash()
+
+
+def test_mempool_evicts_oldest_when_full():
+    mempool = Mempool(max_size=2)
+    txs = [Transaction([TxInput("a" * 64, i)], [TxOutput(1, "bob")]) for i in range(3)]
+    for tx in txs:
+        mempool.add(tx)
+
+    assert len(mempool) == 2
+    assert txs[0] not in mempool
+    assert list(mempool) == txs[1:]
+    assert mempool.get_spender("a" * 64, 0) is None
+
+
+def test_parallel_mining_finds_valid_nonce(blockchain):
+    block = blockchain.mine_block("miner1", workers=2)
+    assert block.hash().startswith("0" * blockchain.difficulty)
+    assert block.previous_hash == blockchain.chain[-1].hash()
+
+
+def test_cancelled_mining_returns_none(blockchain):
+    blockchain.difficulty = 64
+    cancel_event = threading.Event()
+    cancel_event.set()
+    assert blockchain.mine_block("miner1", workers=2, cancel_event=cancel_event) is None
+
+
+def test_fast_nonce_search_matches_block_hash():
+    block = Block(1, "ab" * 32, [Transaction([], [TxOutput(50, "miner1")], {"height": 1})], 0, 1720000000.5)
+    for difficulty in (1, 2, 3):
+        nonce = 0
+        while not Block(1, block.previous_hash, block.transactions, nonce, block.timestamp).hash().startswith("0" * difficulty):
+            nonce += 1
+        result = find_nonce(block, difficulty)
+        assert result.nonce == nonce
+        assert result.attempts == nonce + 1
+
+
+def test_block_hash_cache_follows_nonce():
+    block = Block(1, "0" * 64, [], 0, 1720000000.0)
+    first = block.hash()
+    block.nonce += 1
+    assert block.hash() != first
+    assert block.hash() == Block(1, "0" * 64, [], 1, 1720000000.0).hash()
+
+
+def test_chain_hash_index(blockchain):
+    cb = Transaction([], [TxOutput(50, "alice")], {"height": 1})
+    block = Block(1, blockchain.tip_hash, [cb])
+    assert blockchain.add_block(block) is True
+
+    assert blockchain.tip_hash == block.hash()
+    assert blockchain.has_block(block.hash())
+    assert blockchain.get_height(block.hash()) == 1
+    assert blockchain.get_height(blockchain.chain[0].hash()) == 0
+
+
+def test_unsigned_transaction_is_rejected(blockchain, alice):
+    _, address = alice
+    cb = Transaction([], [TxOutput(100, address)])
+    blockchain.chain.append(Block(1, blockchain.chain[-1].hash(), [cb]))
+    blockchain.rebuild_utxo_set()
+
+    tx = Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")])
+    assert blockchain.add_transaction(tx) is False
+    assert blockchain.validate_block(Block(2, blockchain.chain[-1].hash(), [tx])) is False
+
+
+def test_parallel_batch_verification_matches_serial(alice, monkeypatch):
+    monkeypatch.setattr(Constants, "PARALLEL_VERIFY_THRESHOLD", 2)
+    privkey, _ = alice
+    txs = [_signed(Transaction([TxInput("a" * 64, i)], [TxOutput(1, "bob")]), privkey) for i in range(4)]
+    txs[2].inputs[0].signature = txs[1].inputs[0].signature
+    items = [item for tx in txs for item in tx.signature_items()]
+
+    assert verify_batch(items, workers=2) == [True, True, False, True]
+    signature_cache.clear()
+    assert verify_batch(items, workers=1) == [True, True, False, True]
+
+
+def test_verified_signatures_are_cached(blockchain, alice, monkeypatch):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address)])
+    blockchain.chain.append(Block(1, blockchain.chain[-1].hash(), [cb]))
+    blockchain.rebuild_utxo_set()
+
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")]), privkey)
+    assert blockchain.add_transaction(tx) is True
+    assert tx.signature_items()[0] in signature_cache
+
+    monkeypatch.setattr(verification, "_verify_item", lambda item: pytest.fail("signature verified twice"))
+    block = Block(2, blockchain.chain[-1].hash(), [tx])
+    assert blockchain.validate_block(block) is True
+    assert tx.is_valid(blockchain.utxo_set) is True
+
+
+def test_block_store_restores_chain(tmp_path):
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    for height in (1, 2):
+        cb = Transaction([], [TxOutput(50, "alice")], {"height": height})
+        assert blockchain.add_block(Block(height, blockchain.tip_hash, [cb])) is True
+
+    restored = Blockchain(BlockStore(str(tmp_path)))
+    assert [b.hash() for b in restored.chain] == [b.hash() for b in blockchain.chain]
+    assert restored.get_balance("alice") == 100
+
+
+def test_chain_keeps_headers_and_reloads_evicted_bodies(tmp_path, monkeypatch):
+    monkeypatch.setattr(Constants, "BLOCK_CACHE_SIZE", 2)
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    blocks = []
+    for height in (1, 2, 3, 4):
+        blocks.append(Block(height, blockchain.tip_hash, [Transaction([], [TxOutput(50, "alice")], {"height": height})]))
+        assert blockchain.add_block(blocks[-1]) is True
+
+    assert all(isinstance(header, BlockHeader) for header in blockchain.headers)
+    assert len(blockchain._bodies) == 2
+    assert blockchain.chain[1] is not blocks[0]
+    assert blockchain.chain[1].to_dict() == blocks[0].to_dict()
+    assert [b.hash() for b in blockchain.chain] == [blockchain.chain[0].hash()] + [b.hash() for b in blocks]
+
+    fork = blockchain.headers[:2] + [Block(2, blocks[0].hash(), [Transaction([], [TxOutput(50, "bob")], {"height": 2})])]
+    for height in (3, 4, 5):
+        fork.append(Block(height, fork[-1].hash(), [Transaction([], [TxOutput(50, "bob")], {"height": height})]))
+    assert blockchain.try_to_update_chain(fork) is True
+    assert blockchain.get_balance("alice") == 50
+    assert blockchain.get_balance("bob") == 200
+    assert len(blockchain._bodies) == 2
+
+
+def test_block_store_truncates_across_segments(tmp_path):
+    store = BlockStore(str(tmp_path), segment_size=1)
+    blocks = [Block(0, "0" * 64, [], 0, 1720000000.0)]
+    for height in (1, 2, 3):
+        blocks.append(Block(height, blocks[-1].hash(), [Transaction([], [TxOutput(50, "alice")], {"height": height})]))
+    for block in blocks:
+        store.append(block)
+
+    store.truncate(2)
+    assert len(BlockStore(str(tmp_path))) == 2
+    assert store.read_block(1).hash() == blocks[1].hash()
+    store.append(blocks[2])
+    assert [b.hash() for b in BlockStore(str(tmp_path)).iter_blocks()] == [b.hash() for b in blocks[:3]]
+    assert [h.hash() for h in BlockStore(str(tmp_path)).iter_headers()] == [b.hash() for b in blocks[:3]]
+
+
+def test_restart_reads_headers_without_block_bodies(tmp_path, monkeypatch):
+    monkeypatch.setattr(Constants, "UTXO_SNAPSHOT_INTERVAL", 2)
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    for height in (1, 2):
+        assert blockchain.add_block(Block(height, blockchain.tip_hash, [create_coinbase_tx("alice", 50, height)]))
+
+    parse = DeserializeService.deserialize_block
+    monkeypatch.setattr(DeserializeService, "deserialize_block", lambda data: pytest.fail("block body read on restart"))
+    restored = Blockchain(BlockStore(str(tmp_path)))
+    assert restored.tip_hash == blockchain.tip_hash
+    assert restored.get_balance("alice") == 100
+
+    monkeypatch.setattr(DeserializeService, "deserialize_block", parse)
+    assert restored.chain[1].hash() == blockchain.chain[1].hash()
+
+
+def test_block_store_backfills_missing_header_records(tmp_path):
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    for height in (1, 2):
+        assert blockchain.add_block(Block(height, blockchain.tip_hash, [create_coinbase_tx("alice", 50, height)]))
+    for name in os.listdir(tmp_path):
+        if name.startswith("hdr"):
+            os.remove(tmp_path / name)
+
+    restored = Blockchain(BlockStore(str(tmp_path)))
+    assert [h.hash() for h in restored.headers] == [h.hash() for h in blockchain.headers]
+    assert len(list(BlockStore(str(tmp_path)).iter_headers())) == 3
+
+
+def test_disconnect_tip_restores_spent_outputs(blockchain, alice):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address)], {"height": 1})
+    assert blockchain.add_block(Block(1, blockchain.tip_hash, [cb])) is True
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")]), privkey)
+    block = Block(2, blockchain.tip_hash, [tx])
+    assert blockchain.add_block(block) is True
+
+    assert blockchain.disconnect_tip() is block
+    assert blockchain.get_balance(address) == 100
+    assert blockchain.get_balance("bob") == 0
+    assert not blockchain.has_block(block.hash())
+
+
+def test_restart_loads_utxo_snapshot_and_replays_tail(tmp_path, alice, monkeypatch):
+    monkeypatch.setattr(Constants, "UTXO_SNAPSHOT_INTERVAL", 2)
+    privkey, address = alice
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    cb = Transaction([], [TxOutput(100, address)], {"height": 1})
+    blockchain.add_block(Block(1, blockchain.tip_hash, [cb]))
+    blockchain.add_block(Block(2, blockchain.tip_hash, [Transaction([], [TxOutput(50, address)], {"height": 2})]))
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")]), privkey)
+    blockchain.add_block(Block(3, blockchain.tip_hash, [tx]))
+
+    monkeypatch.setattr(Blockchain, "rebuild_utxo_set", lambda self: pytest.fail("full UTXO rebuild on restart"))
+    restored = Blockchain(BlockStore(str(tmp_path)))
+    assert restored.get_balance(address) == 50
+    assert restored.get_balance("bob") == 100
+
+    restored.disconnect_tip()
+    assert restored.get_balance(address) == 150
+    assert len(BlockStore(str(tmp_path))) == 3
+
+
+def test_restart_backfills_a_lagging_undo_log(tmp_path, alice, monkeypatch):
+    monkeypatch.setattr(Constants, "UTXO_SNAPSHOT_INTERVAL", 2)
+    privkey, address = alice
+    blockchain = Blockchain(BlockStore(str(tmp_path)))
+    cb = Transaction([], [TxOutput(100, address)], {"height": 1})
+    blockchain.add_block(Block(1, blockchain.tip_hash, [cb]))
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")]), privkey)
+    blockchain.add_block(Block(2, blockchain.tip_hash, [tx]))
+    blockchain.add_block(Block(3, blockchain.tip_hash, [Transaction([], [TxOutput(50, address)], {"height": 3})]))
+
+    # As after a crash between writing a block and its undo record
+    store = BlockStore(str(tmp_path))
+    store._undo.truncate(1)
+    restored = Blockchain(store)
+    assert store.undo_height() == 4
+    assert restored.get_balance("bob") == 100
+
+    monkeypatch.setattr(Blockchain, "rebuild_utxo_set", lambda self: pytest.fail("UTXO rebuild on disconnect"))
+    restored.disconnect_tip()
+    restored.disconnect_tip()
+    assert restored.get_balance(address) == 100
+    assert restored.get_balance("bob") == 0
+
+
+def test_reorg_disconnects_only_diverging_blocks(blockchain, alice):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address)], {"height": 1})
+    blockchain.add_block(Block(1, blockchain.tip_hash, [cb]))
+    common = list(blockchain.chain)
+
+    tx = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")]), privkey)
+    blockchain.add_block(Block(2, blockchain.tip_hash, [Transaction([], [TxOutput(50, "miner1")], {"height": 2}), tx]))
+
+    fork = common + [Block(2, common[-1].hash(), [Transaction([], [TxOutput(50, "miner2")], {"height": 2})])]
+    fork.append(Block(3, fork[-1].hash(), [Transaction([], [TxOutput(50, "miner2")], {"height": 3})]))
+
+    assert blockchain.try_to_update_chain(fork) is True
+    assert [b.hash() for b in blockchain.chain] == [b.hash() for b in fork]
+    assert blockchain.get_balance("miner1") == 0
+    assert blockchain.get_balance("miner2") == 100
+    assert tx in blockchain.pending_txs
+
+
+def test_reorg_to_invalid_chain_keeps_current_chain(blockchain):
+    blockchain.add_block(Block(1, blockchain.tip_hash, [Transaction([], [TxOutput(50, "miner1")], {"height": 1})]))
+    original = [b.hash() for b in blockchain.chain]
+
+    fork = [blockchain.chain[0], Block(1, blockchain.chain[0].hash(), [Transaction([], [TxOutput(50, "miner2")], {"height": 1})])]
+    fork.append(Block(2, fork[-1].hash(), [Transaction([TxInput("f" * 64, 0, "", "")], [TxOutput(10, "bob")])]))
+
+    assert blockchain.try_to_update_chain(fork) is False
+    assert [b.hash() for b in blockchain.chain] == original
+    assert blockchain.get_balance("miner1") == 50
+    assert blockchain.get_balance("miner2") == 0
+
+
+def test_failed_reorg_keeps_pending_and_branch_transactions(blockchain, alice):
+    privkey, address = alice
+    cb = Transaction([], [TxOutput(100, address), TxOutput(100, address)], {"height": 1})
+    blockchain.add_block(Block(1, blockchain.tip_hash, [cb]))
+    blockchain.add_block(Block(2, blockchain.tip_hash, [Transaction([], [TxOutput(50, "miner1")], {"height": 2})]))
+    pending = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "bob")]), privkey)
+    assert blockchain.add_transaction(pending) is True
+
+    conflicting = _signed(Transaction([TxInput(cb.hash(), 0, "", "")], [TxOutput(100, "carol")]), privkey)
+    branch_only = _signed(Transaction([TxInput(cb.hash(), 1, "", "")], [TxOutput(100, "dave")]), privkey)
+    fork = list(blockchain.chain[:2])
+    fork.append(Block(2, fork[-1].hash(), [Transaction([], [TxOutput(50, "miner2")], {"height": 2}),
+                                           conflicting, branch_only]))
+    fork.append(Block(3, fork[-1].hash(), [Transaction([TxInput("f" * 64, 0, "", "")], [TxOutput(10, "bob")])]))
+
+    assert blockchain.try_to_update_chain(fork) is False
+    assert blockchain.get_balance("miner1") == 50
+    assert pending in blockchain.pending_txs
+    assert branch_only in blockchain.pending_txs
+    assert conflicting not in blockchain.pending_txs
+
+
+def test_headers_first_sync_fetches_only_missing_blocks(blockchain):
+    for height in (1, 2, 3):
+        blockchain.add_block(Block(height, blockchain.tip_hash, [Transaction([], [TxOutput(50, "miner1")], {"height": height})]))
+    joining = Blockchain()
+    joining.add_block(blockchain.chain[1])
+
+    headers = blockchain.get_headers_after(joining.get_locator(), limit=10)
+    assert [header.index for header in headers] == [2, 3]
+    assert [header.hash() for header in headers] == [block.hash() for block in blockchain.chain[2:]]
+    assert joining.connects_headers(headers)
+
+    missing = blockchain.get_blocks(headers[0].index, headers[-1].index)
+    assert joining.try_to_update_chain(joining.chain[:2] + missing) is True
+    assert joining.tip_hash == blockchain.tip_hash
+    assert joining.get_balance("miner1") == 150
+
+
+def test_binary_wire_format_round_trips_blocks(alice):
+    privkey, address = alice
+    cb = create_coinbase_tx(address, 50, 1)
+    tx = _signed(Transaction([TxInput(cb.hash(), 0)], [TxOutput(30, "bob"), TxOutput(20, address)]), privkey)
+    block = Block(1, "0" * 64, [cb, tx], 42, 1720000000.5)
+    message = {"type": MessageType.BLOCK, "data": block.to_dict()}
+
+    raw = wire_format.encode(message, wire_format.BINARY_FORMAT)
+    assert wire_format.is_binary(raw)
+    assert len(raw) < len(wire_format.encode(message, wire_format.JSON_FORMAT)) / 2
+
+    decoded = wire_format.decode(raw)
+    assert decoded == json.loads(json.dumps(message))
+    assert DeserializeService.deserialize_block(decoded["data"]).hash() == block.hash()
+
+
+def test_binary_wire_format_falls_back_to_json():
+    block = Block(1, "0" * 64, [], 0, 1720000000)
+    message = {"type": MessageType.BLOCK, "data": block.to_dict()}
+    assert not wire_format.is_binary(wire_format.encode(message, wire_format.BINARY_FORMAT))
+    assert wire_format.decode(wire_format.encode(message, wire_format.BINARY_FORMAT)) == message
+
+
+def test_frames_keep_message_boundaries():
+    async def scenario():
+        reader = asyncio.StreamReader()
+        for payload in (b"first", b"", b"x" * 100_000):
+            reader.feed_data(len(payload).to_bytes(4, "big") + payload)
+        reader.feed_eof()
+        return [await read_frame(reader) for _ in range(4)]
+
+    assert asyncio.run(scenario()) == [b"first", b"", b"x" * 100_000, None]
+
+
+def test_peer_connection_reuses_one_socket():
+    async def scenario():
+        received = []
+        connections = []
+
+        async def handle(reader, writer):
+            connections.append(writer)
+            while (frame := await read_frame(reader)) is not None:
+                received.append(frame)
+
+        server = await asyncio.start_server(handle, "127.0.0.1", 0)
+        async with server:
+            connection = PeerConnection(server.sockets[0].getsockname())
+            for i in range(3):
+                assert connection.send(f"message {i}".encode())
+            await connection.close(timeout=5)
+            await asyncio.sleep(0.1)
+        return received, len(connections)
+
+    assert asyncio.run(scenario()) == ([b"message 0", b"message 1", b"message 2"], 1)
+
+
+def test_message_queue_serves_blocks_first_and_batches_transactions():
+    async def scenario():
+        messages = MessageQueue(asyncio.get_running_loop())
+        for i in range(3):
+            messages.put({"type": MessageType.TX, "data": i})
+        messages.put({"type": MessageType.FINALISE_BLOCK, "data": "block"})
+        messages.put({"type": MessageType.TX, "data": 3})
+        await asyncio.sleep(0)
+        assert messages.depths() == {"consensus": 1, "control": 0, "transactions": 4}
+
+        first = await messages.get_batch(3)
+        second = await messages.get_batch(3)
+        third = await messages.get_batch(3)
+        return [[message["data"] for _, message in batch] for batch in (first, second, third)]
+
+    assert asyncio.run(scenario()) == [["block"], [0, 1, 2], [3]]
+
+
+def test_message_metrics_track_latency_per_type():
+    metrics = MessageMetrics()
+    metrics.record(MessageType.TX, 0.5)
+    metrics.record(MessageType.TX, 1.5)
+    metrics.record(MessageType.BLOCK, 0.25)
+    assert metrics.snapshot() == {
+        MessageType.TX: {"count": 2, "avg_latency": 1.0, "max_latency": 1.5},
+        MessageType.BLOCK: {"count": 1, "avg_latency": 0.25, "max_latency": 0.25}
+    }
+
+
+def test_peer_inventory_filters_known_hashes():
+    inventory = PeerInventory(max_per_peer=2)
+    peer = ("127.0.0.1", 5000)
+    inventory.mark(peer, ["a", "b"])
+    assert inventory.unseen(peer, ["a", "b", "c"]) == ["c"]
+    inventory.mark(peer, ["c"])
+    assert inventory.unseen(peer, ["a", "c"]) == ["a"]
+    assert inventory.unseen(("127.0.0.1", 5001), ["a"]) == ["a"]
+
+
+def test_request_tracker_claims_each_hash_once_until_timeout(monkeypatch):
+    tracker = RequestTracker(timeout=30)
+    first, second = ("127.0.0.1", 5000), ("127.0.0.1", 5001)
+    monkeypatch.setattr("inventory.time.monotonic", lambda: 100.0)
+    assert tracker.claim(first, ["a", "b"]) == ["a", "b"]
+    assert tracker.claim(second, ["b", "c"]) == ["c"]
+    assert tracker.complete("b") == first
+
+    monkeypatch.setattr("inventory.time.monotonic", lambda: 131.0)
+    assert tracker.claim(second, ["a", "b"]) == ["a", "b"]
+
+
+def _make_node(tmp_path, port):
+    wallet_file = str(tmp_path / f"wallet{port}.txt")
+    save_wallet(wallet_file, generate_keypair()[0])
+    node = Node("127.0.0.1", port, Role.USER, wallet_file=wallet_file)
+    node._external_ip = "127.0.0.1"
+    return node
+
+
+def test_node_fetches_announced_transactions_once(tmp_path, alice):
+    privkey, address = alice
+    node = _make_node(tmp_path, 5000)
+    sent = []
+    node._send_to_peer = lambda peer, message: sent.append((peer, message))
+    first, second = ("127.0.0.1", 5001), ("127.0.0.1", 5002)
+    node.peers.update([first, second])
+
+    cb = create_coinbase_tx(address, 50, 1)
+    node.blockchain.utxo_set.add_output(cb.hash(), 0, cb.outputs[0])
+    tx = _signed(Transaction([TxInput(cb.hash(), 0)], [TxOutput(50, "bob")]), privkey)
+
+    for peer in (first, second):
+        node._handle_message({"type": MessageType.INV,
+                              "data": {"host": peer[0], "port": peer[1], "txs": [tx.hash()], "blocks": []}})
+    assert [(peer, message["type"]) for peer, message in sent] == [(first, MessageType.GET_DATA)]
+
+    sent.clear()
+    node._handle_message({"type": MessageType.TX, "data": tx.to_dict()})
+    assert tx in node.blockchain.pending_txs
+    assert sent == []
+
+
+def test_node_builds_and_applies_mined_blocks_on_the_chain_thread(tmp_path):
+    node = _make_node(tmp_path, 5000)
+    node.role = Role.MINER
+    mining, chain, queued = [], [], []
+    node._mining_executor.submit = lambda fn, *args: mining.append((fn, args))
+    node._chain_executor.submit = lambda fn, *args: chain.append((fn, args))
+    node.message_queue.put = queued.append
+
+    node._handle_message({"type": MessageType.MINING})
+    (fn, (template, cancel_event)), = mining
+    assert template.previous_hash == node.blockchain.tip_hash and template.nonce == 0
+    fn(template, cancel_event)
+    (on_mined, (block,)), = chain
+    assert block.hash().startswith("0" * node.blockchain.difficulty)
+
+    node.blockchain.add_block(Block(1, node.blockchain.tip_hash, [create_coinbase_tx("other", 50, 1)]))
+    on_mined(block)
+    assert queued == []
+    node.blockchain.disconnect_tip()
+    on_mined(block)
+    assert [message["type"] for message in queued] == [MessageType.BLOCK]
+
+
+def test_node_reads_wallet_outputs_on_the_chain_thread(tmp_path, monkeypatch):
+    node = _make_node(tmp_path, 5000)
+    node.blockchain.add_block(Block(1, node.blockchain.tip_hash, [create_coinbase_tx(node.address, 50, 1)]))
+    threads = []
+    read = node.blockchain.get_spendable_outputs
+    monkeypatch.setattr(node.blockchain, "get_spendable_outputs",
+                        lambda address: threads.append(threading.current_thread().name) or read(address))
+
+    assert [txout.amount for _, _, txout in node.get_spendable_outputs(node.address)] == [50]
+    assert node.get_tip_block().hash() == node.blockchain.tip_hash
+    assert threads[0].startswith("chain")
+
+    mempool = Mempool()
+    spent = mempool.spent_outpoints()
+    mempool.add(Transaction([TxInput("ab" * 32, 0)], [TxOutput(1, "bob")]))
+    assert spent == []
+
+
+def _mempool_block(privkey, address, count, previous_hash="0" * 64):
+    txs = []
+    for i in range(count):
+        cb = create_coinbase_tx(address, 50, i + 1)
+        txs.append(_signed(Transaction([TxInput(cb.hash(), 0)], [TxOutput(50, f"bob{i}")]), privkey))
+    return Block(1, previous_hash, [create_coinbase_tx(address, 50, 100)] + txs, 7, 1720000000.5), txs
+
+
+def test_compact_block_rebuilds_from_mempool(alice):
+    privkey, address = alice
+    block, txs = _mempool_block(privkey, address, 20)
+    mempool = Mempool()
+    for tx in txs[:-2]:
+        mempool.add(tx)
+
+    compact = CompactBlock.from_block(block)
+    full_size = len(wire_format.encode({"type": MessageType.BLOCK, "data": block.to_dict()}, wire_format.BINARY_FORMAT))
+    compact_size = len(wire_format.encode({"type": MessageType.COMPACT_BLOCK,
+                                           "data": {"host": "h", "port": 1, "block": compact.to_dict()}},
+                                          wire_format.BINARY_FORMAT))
+    assert compact_size * 5 < full_size
+
+    partial = DeserializeService.deserialize_compact_block(
+        {"host": "h", "port": 1, "block": json.loads(json.dumps(compact.to_dict()))})[1].reconstruct(mempool)
+    assert partial.missing() == [19, 20]
+    assert partial.to_block() is None
+    partial.fill([19, 20], txs[-2:])
+    assert partial.to_block().hash() == block.hash()
+
+
+def test_nodes_relay_blocks_as_compact_blocks(tmp_path, alice):
+    privkey, address = alice
+    miner, user = _make_node(tmp_path, 5000), _make_node(tmp_path, 5001)
+    miner.peers.add(("127.0.0.1", 5001))
+    user.peers.add(("127.0.0.1", 5000))
+    sent = []
+
+    def route(target):
+        def send(peer, message):
+            sent.append(message["type"])
+            target._handle_message(json.loads(json.dumps(message)))
+        return send
+
+    miner._send_to_peer, user._send_to_peer = route(user), route(miner)
+    miner._broadcast = user._broadcast = lambda message: None
+
+    user.blockchain.chain = list(miner.blockchain.chain)
+    block, txs = _mempool_block(privkey, address, 5, miner.blockchain.tip_hash)
+    for tx in txs:
+        user.blockchain.utxo_set.add_output(tx.inputs[0].tx_id, 0, TxOutput(50, address))
+    for tx in txs[:3]:
+        user.blockchain.pending_txs.add(tx)
+    miner._register_pending_block(block.hash(), block)
+    miner._announce(block_hashes=[block.hash()])
+
+    assert sent == [MessageType.INV, MessageType.GET_DATA, MessageType.COMPACT_BLOCK,
+                    MessageType.GET_BLOCK_TXN, MessageType.BLOCK_TXN]
+    assert user._find_block(block.hash()).hash() == block.hash()
+
+
+def test_block_votes_carry_hashes_and_count_distinct_peers(tmp_path, alice, monkeypatch):
+    privkey, address = alice
+    node = _make_node(tmp_path, 5000)
+    voters = [("127.0.0.1", port) for port in (5001, 5002, 5003, 5004)]
+    node.peers.update(voters)
+    broadcasts = []
+    node._broadcast = broadcasts.append
+    node._send_to_peer = lambda peer, message: None
+    validations = []
+    validate = node.blockchain.validate_block_view
+    monkeypatch.setattr(node.blockchain, "validate_block_view", lambda block: validations.append(block) or validate(block))
+
+    block = Block(1, node.blockchain.tip_hash, [create_coinbase_tx(address, 50, 1)], 0, 1720000000.5)
+    node._receive_block(block)
+    node._receive_block(block)
+    assert [message["data"] for message in broadcasts] == [
+        {"host": "127.0.0.1", "port": 5000, "block_hash": block.hash()}]
+
+    for voter in (voters[0], voters[0], voters[1]):
+        node._handle_message({"type": MessageType.REBROADCAST,
+                              "data": {"host": voter[0], "port": voter[1], "block_hash": block.hash()}})
+    assert node._get_best_pending_block() == (block, 2)
+    assert len(validations) == 1
+
+    node._handle_message({"type": MessageType.FINALISE_BLOCK,
+                          "data": {"host": voters[0][0], "port": voters[0][1], "block_hash": block.hash()}})
+    assert node.blockchain.tip_hash == block.hash()
+    assert len(validations) == 1
+
+
+def test_node_revalidates_a_voted_block_once_the_tip_moves(tmp_path, alice):
+    privkey, address = alice
+    node = _make_node(tmp_path, 5000)
+    block = Block(1, node.blockchain.tip_hash, [create_coinbase_tx(address, 50, 1)], 0, 1720000000.5)
+    assert node._is_valid_block(block)
+
+    node.blockchain.add_block(Block(1, node.blockchain.tip_hash, [create_coinbase_tx("other", 50, 1)]))
+    node.blockchain.disconnect_tip()
+    assert node.verify_and_add_block(block) is True
+    node.blockchain.disconnect_tip()
+    node.blockchain.add_block(Block(1, node.blockchain.tip_hash, [create_coinbase_tx("other", 50, 1)]))
+    assert not node._is_valid_block(block)
+
+
+def _naive_merkle_root(hashes):
+    level = [bytes.fromhex(h) for h in hashes]
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 8, 13])
+def test_merkle_tree_appends_and_proves_every_leaf(size):
+    hashes = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(size)]
+    tree = MerkleTree(hashes)
+    assert tree.root() == _naive_merkle_root(hashes)
+    for index, item in enumerate(hashes):
+        assert verify_proof(item, index, tree.proof(index), tree.root(), size)
+    assert not verify_proof("ff" * 32, 0, tree.proof(0), tree.root(), size)
+    with pytest.raises(IndexError):
+        tree.proof(size)
+
+
+@pytest.mark.parametrize("size", [3, 5, 13])
+def test_merkle_proof_rejects_the_duplicated_slot(size):
+    hashes = [hashlib.sha256(str(i).encode()).hexdigest() for i in range(size)]
+    tree = MerkleTree(hashes)
+    last = tree.proof(size - 1)
+    # The odd last leaf is paired with itself, so its proof also fits the slot one past the end
+    assert verify_proof(hashes[-1], size - 1, last, tree.root(), size)
+    assert not verify_proof(hashes[-1], size, last, tree.root(), size)
+    assert not verify_proof(hashes[-1], size - 1, last, tree.root(), size - 1)
+    assert not verify_proof(hashes[-1], size - 1, last[:-1], tree.root(), size)
+
+
+def test_block_header_verifies_transaction_inclusion(alice):
+    privkey, address = alice
+    block, txs = _mempool_block(privkey, address, 6)
+    header = block.header()
+    index, proof = block.tx_proof(txs[3].hash())
+    assert header.has_transaction(txs[3].hash(), index, proof, len(block.transactions))
+    assert not header.has_transaction(txs[2].hash(), index, proof, len(block.transactions))
+    assert block.tx_proof("ab" * 32) is None
+
+    old_hash = block.hash()
+    extra = _mempool_block(privkey, address, 1)[1][0]
+    block.add_transaction(extra)
+    assert block.hash() != old_hash
+    assert block.merkle_root == _naive_merkle_root([tx.hash() for tx in block.transactions])
+
+
+def test_block_header_hash_is_cached(monkeypatch):
+    block = Block(1, "ab" * 32, [], 7, 1720000000.5)
+    header = block.header()
+    parsed = BlockHeader(header.index, header.previous_hash, header.nonce, header.timestamp, header.tx_hash)
+    assert header.hash() == parsed.hash() == block.hash()
+
+    calls = []
+    monkeypatch.setattr("blockchain.header_hash", lambda *args: calls.append(args) or "cd" * 32)
+    assert parsed.hash() == block.hash()
+    parsed.nonce = 8
+    assert parsed.hash() == "cd" * 32
+    assert parsed.hash() == "cd" * 32
+    assert len(calls) == 1
+
+
+def _mined_block(index, previous_hash, transactions):
+    block = Block(index, previous_hash, transactions, 0, 1720000000.5 + index)
+    block.nonce = find_nonce(block, Constants.DIFFICULTY).nonce
+    return block
+
+
+def test_light_chain_tracks_proven_wallet_outputs(alice):
+    privkey, address = alice
+    light = LightChain([address])
+    coinbase = create_coinbase_tx(address, 50, 1)
+    first = _mined_block(1, light.tip_hash, [coinbase])
+    spend = _signed(Transaction([TxInput(coinbase.hash(), 0)], [TxOutput(20, "bob"), TxOutput(30, address)]), privkey)
+    second = _mined_block(2, first.hash(), [create_coinbase_tx("miner", 50, 2), spend])
+
+    lazy = Block(1, light.tip_hash, [coinbase], first.nonce + 1, first.timestamp)
+    while lazy.hash().startswith("0" * Constants.DIFFICULTY):
+        lazy.nonce += 1
+    assert not light.add_headers([lazy.header()])
+
+    index, proof = second.tx_proof(spend.hash())
+    assert not light.add_matched_block(second.header(), 2, [(spend, index, proof[::-1] + ["00" * 32])])
+    # Proofs for a block ahead of the known headers wait until its header arrives
+    assert not light.add_matched_block(second.header(), 2, [(spend, index, proof)])
+    assert light.get_balance(address) == 0
+
+    assert not light.add_matched_block(first.header(), 1, [(coinbase, 1, first.tx_proof(coinbase.hash())[1])])
+    assert not light.add_matched_block(first.header(), 1, [(coinbase, *first.tx_proof(coinbase.hash()))] * 2)
+    assert light.add_matched_block(first.header(), 1, [(coinbase, *first.tx_proof(coinbase.hash()))])
+    assert light.get_balance(address) == 50
+    assert light.add_headers([second.header()])
+    assert light.get_height(second.hash()) == 2
+    assert light.get_balance(address) == 30
+
+
+def test_full_node_serves_merkle_blocks_to_light_subscribers(tmp_path, alice):
+    privkey, address = alice
+    full = _make_node(tmp_path, 5000)
+    light_peer = ("127.0.0.1", 5001)
+    full.peers.add(light_peer)
+    sent = []
+    full._send_to_peer = lambda peer, message: sent.append((peer, message))
+
+    block, txs = _mempool_block(privkey, address, 3, previous_hash=full.blockchain.tip_hash)
+    full.blockchain.chain = list(full.blockchain.chain) + [block]
+    full._handle_message({"type": MessageType.HELLO,
+                          "data": {"host": "127.0.0.1", "port": 5001, "formats": ["json"], "ack": True,
+                                   "light": True}})
+    assert full._full_peers() == set()
+    full._handle_message({"type": MessageType.SUBSCRIBE,
+                          "data": {"host": "127.0.0.1", "port": 5001, "addresses": ["bob1"], "from_height": 0}})
+
+    assert [(peer, message["type"]) for peer, message in sent] == [(light_peer, MessageType.MERKLE_BLOCK)]
+    _, header, tx_count, matches = DeserializeService.deserialize_merkle_block(
+        json.loads(json.dumps(sent[0][1]["data"])))
+    assert header.hash() == block.hash() and tx_count == 4
+    assert [(tx.hash(), index) for tx, index, _ in matches] == [(txs[1].hash(), 2)]
+    assert all(header.has_transaction(tx.hash(), index, proof, tx_count) for tx, index, proof in matches)
+
+
+def test_compact_objects_keep_their_dict_form(alice):
+    privkey, address = alice
+    cb = create_coinbase_tx(address, 50, 1)
+    tx = _signed(Transaction([TxInput(cb.hash(), 0)], [TxOutput(50, address), TxOutput(1, "bob")]), privkey)
+    restored = DeserializeService.deserialize_tx(json.loads(json.dumps(tx.to_dict())))
+
+    assert restored.to_dict() == tx.to_dict()
+    assert restored.hash() == tx.hash()
+    assert isinstance(restored.inputs[0]._signature, bytes) and isinstance(restored.outputs[0].address_key, bytes)
+    assert restored.outputs[1].address == "bob" and restored.inputs[0].tx_id == cb.hash()
+    assert TxInput("bad_id", 0).tx_id == "bad_id" and TxInput("AB" * 32, 0).tx_id == "AB" * 32
+    block = Block(1, "ab" * 32, [cb], 0, 1720000000.5)
+    for obj in (restored, restored.inputs[0], restored.outputs[0], block, block.header()):
+        assert not hasattr(obj, "__dict__")
+    assert block.header().previous_hash == "ab" * 32 and block.header().hash() == block.hash()
+
+
+def test_utxo_set_takes_hex_and_stores_raw_keys():
+    utxo_set = UtxoSet()
+    txid, address = "cd" * 32, "ef" * 32
+    utxo_set.add_output(txid, 0, TxOutput(30, address))
+    utxo_set.add_output("plain-id", 1, TxOutput(20, address))
+
+    assert all(isinstance(key, bytes) for key in utxo_set._balances)
+    assert set(utxo_set) == {txid, "plain-id"}
+    assert utxo_set[txid][0].amount == 30
+    assert sorted(utxo_set.outputs_of(address)) == sorted([(txid, 0, utxo_set.get_output(txid, 0)),
+                                                           ("plain-id", 1, utxo_set.get_output("plain-id", 1))])
+    assert utxo_set.get_balance(address) == 50
+    assert utxo_set.spend_output(txid, 0).amount == 30
+    assert utxo_set.get_balance(address) == 20
+    assert utxo_set.to_dict(1, "00" * 32)["outputs"] == [["plain-id", 1, {"amount": 20, "address": address}]]
+
+
+def _coinbase_chain(blockchain, count, address="miner1"):
+    blocks = []
+    for height in range(len(blockchain.chain), len(blockchain.chain) + count):
+        previous_hash = blocks[-1].hash() if blocks else blockchain.tip_hash
+        blocks.append(Block(height, previous_hash, [Transaction([], [TxOutput(50, address)], {"height": height})]))
+    return blocks
+
+
+def test_chain_file_streams_blocks_and_validates_on_import(tmp_path, blockchain):
+    for block in _coinbase_chain(blockchain, 3):
+        assert blockchain.add_block(block)
+    path = str(tmp_path / "chain.jsonl")
+    assert write_chain(path, blockchain.chain) == 4
+    with open(path) as f:
+        assert len(f.readlines()) == 4
+
+    blocks = read_chain(path)
+    assert next(blocks).hash() == blockchain.chain[0].hash()
+    imported = Blockchain()
+    assert import_chain(imported, read_chain(path)) is True
+    assert imported.tip_hash == blockchain.tip_hash
+    assert imported.get_balance("miner1") == 150
+
+    bad = _coinbase_chain(blockchain, 2)
+    bad[1].transactions = [Transaction([TxInput("f" * 64, 0, "", "")], [TxOutput(10, "bob")])]
+    write_chain(path, list(blockchain.chain) + bad)
+    partial = Blockchain()
+    assert import_chain(partial, read_chain(path)) is False
+    assert len(partial.chain) == 5
+
+
+def test_node_connects_synced_chunks_as_they_arrive(tmp_path):
+    node = _make_node(tmp_path, 5000)
+    peer = ("127.0.0.1", 5001)
+    sent = []
+    node._send_to_peer = lambda to, message: sent.append(message["type"])
+    blocks = _coinbase_chain(node.blockchain, 4)
+
+    def chunk(part, last):
+        return {"type": MessageType.BLOCKS,
+                "data": {"host": peer[0], "port": peer[1], "blocks": [b.to_dict() for b in part], "last": last}}
+
+    node._handle_headers(peer, [b.header() for b in blocks])
+    node._handle_message(chunk(blocks[:2], False))
+    assert node.blockchain.tip_hash == blocks[1].hash()
+    assert node._syncs[peer][0] == []
+    node._handle_message(chunk(blocks[2:], True))
+    assert node.blockchain.tip_hash == blocks[3].hash()
+    assert peer not in node._syncs
+    assert sent == [MessageType.GET_BLOCKS]
+
+
+def test_node_keeps_sync_state_per_peer(tmp_path):
+    node = _make_node(tmp_path, 5000)
+    first, second = ("127.0.0.1", 5001), ("127.0.0.1", 5002)
+    node._send_to_peer = lambda to, message: None
+    blocks = _coinbase_chain(node.blockchain, 4)
+
+    def chunk(peer, part, last):
+        return {"type": MessageType.BLOCKS,
+                "data": {"host": peer[0], "port": peer[1], "blocks": [b.to_dict() for b in part], "last": last}}
+
+    node._handle_message(chunk(first, blocks[:2], True))
+    assert len(node.blockchain.chain) == 1
+
+    node._handle_headers(first, [b.header() for b in blocks])
+    node._handle_message(chunk(first, blocks[:2], False))
+    node._handle_headers(second, [b.header() for b in blocks[2:]])
+    assert node._syncs[first] == [[], False]
+    node._handle_message(chunk(first, blocks[2:], True))
+    assert node.blockchain.tip_hash == blocks[3].hash()
+    assert first not in node._syncs and second in node._syncs
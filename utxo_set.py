@@ -0,0 +1,157 @@
+from collections.abc import Mapping
+
+from constants import UndoField, UtxoSnapshotField
+from transaction import TxOutput, pack_hex, unpack_hex
+
+
+class UndoRecord:
+    def __init__(self,
+                 spent: list[tuple[str, int, TxOutput]],
+                 created: list[tuple[str, int]]) -> None:
+        self.spent = spent  # outputs removed from the set, restored on undo
+        self.created = created  # outpoints added to the set, removed on undo
+
+    def to_dict(self) -> dict:
+        return {
+            UndoField.SPENT: [[txid, index, txout.to_dict()] for txid, index, txout in self.spent],
+            UndoField.CREATED: [[txid, index] for txid, index in self.created]
+        }
+
+
+class UtxoSet(Mapping):
+    # Keyed by packed txids and addresses (see transaction.pack_hex); the public API takes and returns hex strings
+    def __init__(self) -> None:
+        self._outputs: dict[bytes | str, dict[int, TxOutput]] = {}
+        self._by_address: dict[bytes | str, dict[tuple[bytes | str, int], TxOutput]] = {}
+        self._balances: dict[bytes | str, int] = {}
+
+    def __getitem__(self, txid: str) -> dict[int, TxOutput]:
+        return self._outputs[pack_hex(txid)]
+
+    def __iter__(self):
+        return (unpack_hex(txid) for txid in self._outputs)
+
+    def __len__(self) -> int:
+        return len(self._outputs)
+
+    def get_output(self, txid: str, index: int) -> TxOutput | None:
+        return self._outputs.get(pack_hex(txid), {}).get(index)
+
+    def add_output(self, txid: str, index: int, txout: TxOutput) -> None:
+        txid = pack_hex(txid)
+        outputs = self._outputs.setdefault(txid, {})
+        previous = outputs.get(index)
+        if previous is not None:
+            self._unindex(txid, index, previous)
+        outputs[index] = txout
+        address = txout.address_key
+        self._by_address.setdefault(address, {})[(txid, index)] = txout
+        self._balances[address] = self._balances.get(address, 0) + txout.amount
+
+    def spend_output(self, txid: str, index: int) -> TxOutput | None:
+        txid = pack_hex(txid)
+        outputs = self._outputs.get(txid)
+        if outputs is None or index not in outputs:
+            return None
+        txout = outputs.pop(index)
+        if not outputs:
+            del self._outputs[txid]
+        self._unindex(txid, index, txout)
+        return txout
+
+    def outputs_of(self, address: str) -> list[tuple[str, int, TxOutput]]:
+        return [(unpack_hex(txid), index, txout)
+                for (txid, index), txout in self._by_address.get(pack_hex(address), {}).items()]
+
+    def get_balance(self, address: str) -> float:
+        return float(self._balances.get(pack_hex(address), 0))
+
+    def clear(self) -> None:
+        self._outputs.clear()
+        self._by_address.clear()
+        self._balances.clear()
+
+    def apply_undo(self, undo: UndoRecord) -> None:
+        for txid, index in undo.created:
+            self.spend_output(txid, index)
+        for txid, index, txout in undo.spent:
+            self.add_output(txid, index, txout)
+
+    def to_dict(self, height: int, block_hash: str) -> dict:
+        return {
+            UtxoSnapshotField.HEIGHT: height,
+            UtxoSnapshotField.BLOCK_HASH: block_hash,
+            UtxoSnapshotField.OUTPUTS: [[unpack_hex(txid), index, txout.to_dict()]
+                                        for txid, outputs in self._outputs.items()
+                                        for index, txout in outputs.items()]
+        }
+
+    def _unindex(self, txid: bytes | str, index: int, txout: TxOutput) -> None:
+        address = txout.address_key
+        owned = self._by_address.get(address)
+        if owned is None:
+            return
+        owned.pop((txid, index), None)
+        self._balances[address] -= txout.amount
+        if not owned:
+            del self._by_address[address]
+            del self._balances[address]
+
+
+class UtxoView:
+    def __init__(self, base: UtxoSet) -> None:
+        self._base = base
+        self._spent: set[tuple[str, int]] = set()
+        self._created: dict[tuple[str, int], TxOutput] = {}
+
+    @property
+    def base(self) -> UtxoSet:
+        return self._base
+
+    def get_output(self, txid: str, index: int) -> TxOutput | None:
+        key = (txid, index)
+        if key in self._created:
+            return self._created[key]
+        if key in self._spent:
+            return None
+        return self._base.get_output(txid, index)
+
+    def add_output(self, txid: str, index: int, txout: TxOutput) -> None:
+        key = (txid, index)
+        if self._base.get_output(txid, index) is not None:
+            self._spent.add(key)
+        self._created[key] = txout
+
+    def spend_output(self, txid: str, index: int) -> TxOutput | None:
+        key = (txid, index)
+        if key in self._created:
+            return self._created.pop(key)
+        if key in self._spent:
+            return None
+        txout = self._base.get_output(txid, index)
+        if txout is not None:
+            self._spent.add(key)
+        return txout
+
+    def outputs_of(self, address: str) -> list[tuple[str, int, TxOutput]]:
+        outputs = [(txid, index, txout) for txid, index, txout in self._base.outputs_of(address)
+                   if (txid, index) not in self._spent]
+        outputs.extend((txid, index, txout) for (txid, index), txout in self._created.items()
+                       if txout.address == address)
+        return outputs
+
+    def get_balance(self, address: str) -> float:
+        return float(sum(txout.amount for _, _, txout in self.outputs_of(address)))
+
+    def commit(self) -> UndoRecord:
+        spent = []
+        for txid, index in self._spent:
+            txout = self._base.spend_output(txid, index)
+            if txout is not None:
+                spent.append((txid, index, txout))
+        for (txid, index), txout in self._created.items():
+            self._base.add_output(txid, index, txout)
+        undo = UndoRecord(spent, list(self._created))
+        self._spent.clear()
+        self._created.clear()
+        return undo
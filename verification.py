@@ -0,0 +1,87 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+
+from constants import Constants
+from wallet import pubkey_to_address, verify
+
+_executor: ProcessPoolExecutor | None = None
+_executor_workers = 0
+
+
+class SignatureCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[tuple[str, int, str, str], None] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, item: tuple[str, int, str, str]) -> bool:
+        with self._lock:
+            if item not in self._entries:
+                return False
+            self._entries.move_to_end(item)
+            return True
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def add(self, item: tuple[str, int, str, str]) -> None:
+        with self._lock:
+            self._entries[item] = None
+            self._entries.move_to_end(item)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+signature_cache = SignatureCache(Constants.SIGNATURE_CACHE_SIZE)
+
+
+def owns_address(pubkey_b64: str, address: str) -> bool:
+    try:
+        return pubkey_to_address(pubkey_b64) == address
+    except ValueError:
+        return False
+
+
+def _verify_item(item: tuple[str, int, str, str]) -> bool:
+    txid, _, signature, pubkey = item
+    return verify(txid, signature, pubkey)
+
+
+def _get_executor(workers: int) -> ProcessPoolExecutor:
+    global _executor, _executor_workers
+    if _executor is None or _executor_workers != workers:
+        if _executor is not None:
+            _executor.shutdown(wait=False)
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        _executor_workers = workers
+    return _executor
+
+
+def verify_signature(item: tuple[str, int, str, str]) -> bool:
+    return verify_batch([item], workers=1)[0]
+
+
+def verify_batch(items: list[tuple[str, int, str, str]], workers: int | None = None) -> list[bool]:
+    results = [item in signature_cache for item in items]
+    unchecked = [i for i, cached in enumerate(results) if not cached]
+    if not unchecked:
+        return results
+
+    pending = [items[i] for i in unchecked]
+    workers = workers or Constants.VERIFY_WORKERS
+    if workers <= 1 or len(pending) < Constants.PARALLEL_VERIFY_THRESHOLD:
+        verified = [_verify_item(item) for item in pending]
+    else:
+        chunksize = max(1, len(pending) // (workers * 4))
+        verified = list(_get_executor(workers).map(_verify_item, pending, chunksize=chunksize))
+
+    for i, ok in zip(unchecked, verified):
+        results[i] = ok
+        if ok:
+            signature_cache.add(items[i])
+    return results
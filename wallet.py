@@ -1,8 +1,12 @@
+import binascii
 import ecdsa
+import functools
 import hashlib
 import base64
 import os
 
+from constants import Constants
+
 
 def generate_keypair() -> (str, str):
     sk = ecdsa.SigningKey.generate(curve=ecdsa.SECP256k1)
@@ -43,11 +47,16 @@ def sign(message: str, privkey_b64: str) -> str:
     return base64.b64encode(signature).decode()
 
 
+@functools.lru_cache(maxsize=Constants.VERIFYING_KEY_CACHE_SIZE)
+def get_verifying_key(pubkey_b64: str) -> ecdsa.VerifyingKey:
+    return ecdsa.VerifyingKey.from_string(base64.b64decode(pubkey_b64), curve=ecdsa.SECP256k1)
+
+
 def verify(message: str, signature_b64: str, pubkey_b64: str) -> bool:
-    vk = ecdsa.VerifyingKey.from_string(base64.b64decode(pubkey_b64), curve=ecdsa.SECP256k1)
     try:
+        vk = get_verifying_key(pubkey_b64)
         vk.verify(base64.b64decode(signature_b64), message.encode())
         return True
-    except ecdsa.BadSignatureError:
+    except (ecdsa.BadSignatureError, ecdsa.MalformedPointError, binascii.Error):
         return False
 
@@ -0,0 +1,403 @@
+import base64
+import binascii
+import json
+import struct
+
+from constants import MessageType, MessageField, TxField, TxInputField, TxOutputField, BlockField, RebroadcastField, \
+    SyncField, InventoryField, CompactBlockField, BlockTxnField
+
+MAGIC = b"\xb7"
+VERSION = 2
+
+JSON_FORMAT = "json"
+BINARY_FORMAT = f"binary/{VERSION}"
+SUPPORTED_FORMATS = [BINARY_FORMAT, JSON_FORMAT]
+
+_RAW = 0
+_TEXT = 1
+_TIMESTAMP = struct.Struct(">d")
+
+
+class _Writer:
+    def __init__(self) -> None:
+        self._parts: list[bytes] = []
+
+    def getvalue(self) -> bytes:
+        return b"".join(self._parts)
+
+    def uint(self, value: int) -> None:
+        if value < 0:
+            raise ValueError("Negative value for an unsigned varint")
+        out = bytearray()
+        while value > 0x7f:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+        self._parts.append(bytes(out))
+
+    def int(self, value: int) -> None:
+        if type(value) is not int:
+            raise ValueError(f"Cannot encode {value!r} as an integer")
+        self.uint(value * 2 if value >= 0 else -value * 2 - 1)
+
+    def bool(self, value: bool) -> None:
+        self._parts.append(b"\x01" if value else b"\x00")
+
+    def bytes(self, value: bytes) -> None:
+        self.uint(len(value))
+        self._parts.append(value)
+
+    def text(self, value: str) -> None:
+        self.bytes(value.encode())
+
+    def timestamp(self, value: float) -> None:
+        if type(value) is not float:
+            raise ValueError(f"Cannot encode {value!r} as a timestamp")
+        self._parts.append(_TIMESTAMP.pack(value))
+
+    def hash(self, value: str) -> None:
+        # 64-char hex hashes and addresses travel as 32 raw bytes, anything else as text
+        try:
+            raw = bytes.fromhex(value)
+        except ValueError:
+            raw = None
+        if raw is not None and len(raw) == 32 and raw.hex() == value:
+            self._parts.append(bytes([_RAW]) + raw)
+        else:
+            self._parts.append(bytes([_TEXT]))
+            self.text(value)
+
+    def base64(self, value: str) -> None:
+        try:
+            raw = base64.b64decode(value, validate=True)
+        except binascii.Error:
+            raw = None
+        if raw is not None and base64.b64encode(raw).decode() == value:
+            self._parts.append(bytes([_RAW]))
+            self.bytes(raw)
+        else:
+            self._parts.append(bytes([_TEXT]))
+            self.text(value)
+
+
+class _Reader:
+    def __init__(self, data: bytes) -> None:
+        self._data = memoryview(data)
+        self._pos = 0
+
+    def _take(self, size: int) -> bytes:
+        if self._pos + size > len(self._data):
+            raise ValueError("Truncated binary message")
+        chunk = self._data[self._pos:self._pos + size].tobytes()
+        self._pos += size
+        return chunk
+
+    def uint(self) -> int:
+        result = 0
+        shift = 0
+        while True:
+            byte = self._take(1)[0]
+            result |= (byte & 0x7f) << shift
+            if not byte & 0x80:
+                return result
+            shift += 7
+
+    def int(self) -> int:
+        value = self.uint()
+        return value // 2 if value % 2 == 0 else -(value + 1) // 2
+
+    def bool(self) -> bool:
+        return self._take(1) != b"\x00"
+
+    def bytes(self) -> bytes:
+        return self._take(self.uint())
+
+    def text(self) -> str:
+        return self.bytes().decode()
+
+    def timestamp(self) -> float:
+        return _TIMESTAMP.unpack(self._take(_TIMESTAMP.size))[0]
+
+    def hash(self) -> str:
+        if self._take(1)[0] == _RAW:
+            return self._take(32).hex()
+        return self.text()
+
+    def base64(self) -> str:
+        if self._take(1)[0] == _RAW:
+            return base64.b64encode(self.bytes()).decode()
+        return self.text()
+
+
+def _write_tx(w: _Writer, tx: dict) -> None:
+    w.uint(len(tx[TxField.INPUTS]))
+    for txin in tx[TxField.INPUTS]:
+        w.hash(txin[TxInputField.TX_ID])
+        w.int(txin[TxInputField.INDEX])
+        w.base64(txin[TxInputField.SIGNATURE])
+        w.base64(txin[TxInputField.PUBKEY])
+    w.uint(len(tx[TxField.OUTPUTS]))
+    for txout in tx[TxField.OUTPUTS]:
+        w.int(txout[TxOutputField.AMOUNT])
+        w.hash(txout[TxOutputField.ADDRESS])
+    metadata = tx.get(TxField.METADATA) or {}
+    w.bytes(json.dumps(metadata, sort_keys=True).encode() if metadata else b"")
+
+
+def _read_tx(r: _Reader) -> dict:
+    inputs = [{
+        TxInputField.TX_ID: r.hash(),
+        TxInputField.INDEX: r.int(),
+        TxInputField.SIGNATURE: r.base64(),
+        TxInputField.PUBKEY: r.base64()
+    } for _ in range(r.uint())]
+    outputs = [{
+        TxOutputField.AMOUNT: r.int(),
+        TxOutputField.ADDRESS: r.hash()
+    } for _ in range(r.uint())]
+    metadata = r.bytes()
+    return {
+        TxField.INPUTS: inputs,
+        TxField.OUTPUTS: outputs,
+        TxField.METADATA: json.loads(metadata) if metadata else {}
+    }
+
+
+def _write_block(w: _Writer, block: dict) -> None:
+    w.int(block[BlockField.INDEX])
+    w.hash(block[BlockField.PREVIOUS_HASH])
+    w.int(block[BlockField.NONCE])
+    w.timestamp(block[BlockField.TIMESTAMP])
+    w.uint(len(block[BlockField.TRANSACTIONS]))
+    for tx in block[BlockField.TRANSACTIONS]:
+        _write_tx(w, tx)
+
+
+def _read_block(r: _Reader) -> dict:
+    index = r.int()
+    previous_hash = r.hash()
+    nonce = r.int()
+    timestamp = r.timestamp()
+    return {
+        BlockField.INDEX: index,
+        BlockField.PREVIOUS_HASH: previous_hash,
+        BlockField.TRANSACTIONS: [_read_tx(r) for _ in range(r.uint())],
+        BlockField.NONCE: nonce,
+        BlockField.TIMESTAMP: timestamp
+    }
+
+
+def _write_header(w: _Writer, header: dict) -> None:
+    w.int(header[BlockField.INDEX])
+    w.hash(header[BlockField.PREVIOUS_HASH])
+    w.int(header[BlockField.NONCE])
+    w.timestamp(header[BlockField.TIMESTAMP])
+    w.hash(header[BlockField.TX_HASH])
+
+
+def _read_header(r: _Reader) -> dict:
+    return {
+        BlockField.INDEX: r.int(),
+        BlockField.PREVIOUS_HASH: r.hash(),
+        BlockField.NONCE: r.int(),
+        BlockField.TIMESTAMP: r.timestamp(),
+        BlockField.TX_HASH: r.hash()
+    }
+
+
+def _write_vote(w: _Writer, data: dict) -> None:
+    w.text(data[RebroadcastField.HOST])
+    w.uint(int(data[RebroadcastField.PORT]))
+    w.hash(data[RebroadcastField.BLOCK_HASH])
+
+
+def _read_vote(r: _Reader) -> dict:
+    # REBROADCAST and FINALISE_BLOCK share the same shape
+    return {
+        RebroadcastField.HOST: r.text(),
+        RebroadcastField.PORT: r.uint(),
+        RebroadcastField.BLOCK_HASH: r.hash()
+    }
+
+
+def _write_headers(w: _Writer, data: dict) -> None:
+    w.text(data[SyncField.HOST])
+    w.uint(int(data[SyncField.PORT]))
+    w.uint(len(data[SyncField.HEADERS]))
+    for header in data[SyncField.HEADERS]:
+        _write_header(w, header)
+
+
+def _read_headers(r: _Reader) -> dict:
+    return {
+        SyncField.HOST: r.text(),
+        SyncField.PORT: r.uint(),
+        SyncField.HEADERS: [_read_header(r) for _ in range(r.uint())]
+    }
+
+
+def _write_blocks(w: _Writer, data: dict) -> None:
+    w.text(data[SyncField.HOST])
+    w.uint(int(data[SyncField.PORT]))
+    w.bool(data[SyncField.LAST])
+    w.uint(len(data[SyncField.BLOCKS]))
+    for block in data[SyncField.BLOCKS]:
+        _write_block(w, block)
+
+
+def _read_blocks(r: _Reader) -> dict:
+    host = r.text()
+    port = r.uint()
+    last = r.bool()
+    return {
+        SyncField.HOST: host,
+        SyncField.PORT: port,
+        SyncField.BLOCKS: [_read_block(r) for _ in range(r.uint())],
+        SyncField.LAST: last
+    }
+
+
+def _write_inventory(w: _Writer, data: dict) -> None:
+    w.text(data[InventoryField.HOST])
+    w.uint(int(data[InventoryField.PORT]))
+    for field in (InventoryField.TXS, InventoryField.BLOCKS):
+        w.uint(len(data[field]))
+        for item in data[field]:
+            w.hash(item)
+
+
+def _read_inventory(r: _Reader) -> dict:
+    return {
+        InventoryField.HOST: r.text(),
+        InventoryField.PORT: r.uint(),
+        InventoryField.TXS: [r.hash() for _ in range(r.uint())],
+        InventoryField.BLOCKS: [r.hash() for _ in range(r.uint())]
+    }
+
+
+def _write_compact_block(w: _Writer, data: dict) -> None:
+    w.text(data[CompactBlockField.HOST])
+    w.uint(int(data[CompactBlockField.PORT]))
+    block = data[CompactBlockField.BLOCK]
+    _write_header(w, block[CompactBlockField.HEADER])
+    w.uint(len(block[CompactBlockField.SHORT_IDS]))
+    for short_id in block[CompactBlockField.SHORT_IDS]:
+        w.bytes(bytes.fromhex(short_id))
+    w.uint(len(block[CompactBlockField.PREFILLED]))
+    for item in block[CompactBlockField.PREFILLED]:
+        w.uint(item[CompactBlockField.INDEX])
+        _write_tx(w, item[CompactBlockField.TX])
+
+
+def _read_compact_block(r: _Reader) -> dict:
+    host = r.text()
+    port = r.uint()
+    header = _read_header(r)
+    short_ids = [r.bytes().hex() for _ in range(r.uint())]
+    prefilled = [{
+        CompactBlockField.INDEX: r.uint(),
+        CompactBlockField.TX: _read_tx(r)
+    } for _ in range(r.uint())]
+    return {
+        CompactBlockField.HOST: host,
+        CompactBlockField.PORT: port,
+        CompactBlockField.BLOCK: {
+            CompactBlockField.HEADER: header,
+            CompactBlockField.SHORT_IDS: short_ids,
+            CompactBlockField.PREFILLED: prefilled
+        }
+    }
+
+
+def _write_get_block_txn(w: _Writer, data: dict) -> None:
+    w.text(data[BlockTxnField.HOST])
+    w.uint(int(data[BlockTxnField.PORT]))
+    w.hash(data[BlockTxnField.BLOCK_HASH])
+    w.uint(len(data[BlockTxnField.INDEXES]))
+    for i in data[BlockTxnField.INDEXES]:
+        w.uint(i)
+
+
+def _read_get_block_txn(r: _Reader) -> dict:
+    return {
+        BlockTxnField.HOST: r.text(),
+        BlockTxnField.PORT: r.uint(),
+        BlockTxnField.BLOCK_HASH: r.hash(),
+        BlockTxnField.INDEXES: [r.uint() for _ in range(r.uint())]
+    }
+
+
+def _write_block_txn(w: _Writer, data: dict) -> None:
+    _write_get_block_txn(w, data)
+    w.uint(len(data[BlockTxnField.TXS]))
+    for tx in data[BlockTxnField.TXS]:
+        _write_tx(w, tx)
+
+
+def _read_block_txn(r: _Reader) -> dict:
+    data = _read_get_block_txn(r)
+    data[BlockTxnField.TXS] = [_read_tx(r) for _ in range(r.uint())]
+    return data
+
+
+# message type -> (type code, payload writer, payload reader)
+_CODECS = {
+    MessageType.TX: (1, _write_tx, _read_tx),
+    MessageType.BLOCK: (2, _write_block, _read_block),
+    MessageType.FINALISE_BLOCK: (3, _write_vote, _read_vote),
+    MessageType.REBROADCAST: (4, _write_vote, _read_vote),
+    MessageType.HEADERS: (5, _write_headers, _read_headers),
+    MessageType.BLOCKS: (6, _write_blocks, _read_blocks),
+    MessageType.INV: (7, _write_inventory, _read_inventory),
+    MessageType.GET_DATA: (8, _write_inventory, _read_inventory),
+    MessageType.COMPACT_BLOCK: (9, _write_compact_block, _read_compact_block),
+    MessageType.GET_BLOCK_TXN: (10, _write_get_block_txn, _read_get_block_txn),
+    MessageType.BLOCK_TXN: (11, _write_block_txn, _read_block_txn),
+}
+_TYPES_BY_CODE = {code: msg_type for msg_type, (code, _, _) in _CODECS.items()}
+
+
+def is_binary(raw: bytes) -> bool:
+    return raw[:1] == MAGIC
+
+
+def encode_message(message: dict) -> bytes | None:
+    codec = _CODECS.get(message.get(MessageField.TYPE))
+    if codec is None:
+        return None
+    code, write, _ = codec
+    w = _Writer()
+    try:
+        write(w, message[MessageField.DATA])
+    except (KeyError, TypeError, ValueError):
+        return None
+    return MAGIC + bytes([VERSION, code]) + w.getvalue()
+
+
+def decode_message(raw: bytes) -> dict:
+    if not is_binary(raw) or len(raw) < 3:
+        raise ValueError("Not a binary message")
+    if raw[1] != VERSION:
+        raise ValueError(f"Unsupported binary format version {raw[1]}")
+    msg_type = _TYPES_BY_CODE.get(raw[2])
+    if msg_type is None:
+        raise ValueError(f"Unknown binary message type {raw[2]}")
+    _, _, read = _CODECS[msg_type]
+    return {
+        MessageField.TYPE: msg_type,
+        MessageField.DATA: read(_Reader(raw[3:]))
+    }
+
+
+def encode(message: dict, wire_format: str) -> bytes:
+    if wire_format == BINARY_FORMAT:
+        raw = encode_message(message)
+        if raw is not None:
+            return raw
+    return json.dumps(message).encode()
+
+
+def decode(raw: bytes) -> dict:
+    if is_binary(raw):
+        return decode_message(raw)
+    return json.loads(raw.decode())